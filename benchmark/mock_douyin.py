@@ -0,0 +1,119 @@
+"""
+本地抖音模拟服务器，用于离线压测，不会访问真实的抖音。
+
+按Host请求头模拟main.py依赖的上游行为：
+- v.douyin.com/<短码>/            302重定向到 www.douyin.com/video/<视频ID>
+- www.douyin.com/video/<视频ID>   视频页面，内嵌RENDER_DATA页面状态数据、douyinvod播放地址和playApi
+- aweme.snssdk.com/aweme/v1/play/ 和 playwm/   经过一次中转后302重定向到 *.douyinvod.com
+- *.douyinvod.com                 返回一小段视频内容
+
+每个请求都可以加上延迟和失败（503）。单独启动：
+    python benchmark/mock_douyin.py --port 9100 --latency 0.05 --failure-rate 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import urllib.parse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
+
+# 模拟服务器的行为参数，启动时由命令行参数覆盖
+settings = {
+    "latency": 0.05,           # 每个请求的平均延迟（秒）
+    "jitter": 0.02,            # 延迟的随机波动范围（秒）
+    "failure_rate": 0.0,       # 返回503的比例
+    "page_link_rate": 1.0,     # 视频页面中带有douyinvod播放地址的比例，其余页面只能通过play接口解析
+    "page_size": 200 * 1024,   # 视频页面的大致大小（字节）
+}
+
+app = FastAPI()
+
+# 短码对应的视频ID，同一个短码总是得到同一个视频ID
+def video_id_for(code):
+    return str(7000000000000000000 + int(hashlib.md5(code.encode()).hexdigest()[:15], 16) % 10 ** 18)
+
+def douyinvod_url(video_id):
+    expires = int(time.time()) + 3600
+    return f"https://v26-web.douyinvod.com/{video_id}/video/tos/mp4/?x-expires={expires}&mime_type=video_mp4"
+
+def play_api_url(video_id):
+    return f"https://aweme.snssdk.com/aweme/v1/play/?video_id={video_id}&ratio=720p&line=0"
+
+# 视频页面：和网页版一样把页面状态数据以URL编码的JSON放在RENDER_DATA中，用空白内容补足页面大小
+def render_video_page(video_id):
+    with_links = random.random() < settings["page_link_rate"]
+    video = {
+        "duration": 15000,
+        "cover": {"url_list": [f"https://p3-sign.douyinpic.com/{video_id}.jpeg"]},
+    }
+    if with_links:
+        video["play_addr"] = {"url_list": [douyinvod_url(video_id)]}
+    state = {"app": {"videoDetail": {"awemeId": video_id, "desc": f"模拟视频 {video_id}", "video": video}}}
+    render_data = urllib.parse.quote(json.dumps(state, ensure_ascii=False))
+    # 页面中的链接和真实页面一样用\u002F转义斜杠
+    play_api = play_api_url(video_id).replace("/", "\\u002F")
+    padding = "<div class=\"feed\"></div>\n" * max(0, settings["page_size"] // 25)
+    return (
+        "<!DOCTYPE html><html><head><title>抖音</title></head><body>\n"
+        f"{padding}"
+        f'<script id="RENDER_DATA" type="application/json">{render_data}</script>\n'
+        f'<script>window.__PLAY__ = {{"playApi":"{play_api}"}};</script>\n'
+        "</body></html>"
+    )
+
+@app.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def handle(request: Request, path: str):
+    delay = settings["latency"] + random.uniform(-settings["jitter"], settings["jitter"])
+    if delay > 0:
+        await asyncio.sleep(delay)
+    if random.random() < settings["failure_rate"]:
+        return Response(status_code=503)
+
+    host = request.headers.get("host", "").split(":")[0]
+    path = "/" + path
+
+    if host == "v.douyin.com":
+        code = path.strip("/") or "default"
+        return RedirectResponse(f"https://www.douyin.com/video/{video_id_for(code)}", status_code=302)
+
+    if host == "www.douyin.com" and path.startswith("/video/"):
+        return HTMLResponse(render_video_page(path.split("/")[2]))
+
+    if host == "aweme.snssdk.com" and path in ("/aweme/v1/play/", "/aweme/v1/playwm/"):
+        # 和真实接口一样先跳转到另一个播放接口，再跳转到douyinvod
+        video_id = request.query_params.get("video_id", "0")
+        return RedirectResponse(f"https://aweme.snssdk.com/aweme/v1/play2/?video_id={video_id}", status_code=302)
+    if host == "aweme.snssdk.com" and path == "/aweme/v1/play2/":
+        return RedirectResponse(douyinvod_url(request.query_params.get("video_id", "0")), status_code=302)
+
+    if host.endswith("douyinvod.com"):
+        return Response(b"\0" * 1024, media_type="video/mp4")
+
+    return Response(status_code=404)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本地抖音模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=settings["latency"], help="每个请求的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=settings["jitter"], help="延迟的随机波动范围（秒）")
+    parser.add_argument("--failure-rate", type=float, default=settings["failure_rate"], help="返回503的比例")
+    parser.add_argument("--page-link-rate", type=float, default=settings["page_link_rate"], help="视频页面中带有播放地址的比例")
+    parser.add_argument("--page-size", type=int, default=settings["page_size"], help="视频页面的大致大小（字节）")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    settings.update(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        page_link_rate=args.page_link_rate,
+        page_size=args.page_size,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,124 @@
+"""
+本地Redis模拟服务器，按RESP协议实现main.py共享缓存后端用到的命令，用于在没有Redis的环境中测试：
+PING、AUTH、SELECT、GET、SET（支持PX/EX）、PTTL、MGET、DEL、FLUSHDB、DBSIZE。
+
+数据只保存在内存中，每个数据库单独保存。单独启动：
+    python benchmark/mock_redis.py --port 6390 --password secret
+"""
+import argparse
+import asyncio
+import time
+
+# 启动参数，由命令行参数覆盖
+settings = {
+    "password": None,
+}
+
+# 每个数据库的数据：{数据库编号: {键: (值, 过期时间或None)}}
+databases = {}
+
+def get_entry(db, key):
+    entry = databases.setdefault(db, {}).get(key)
+    if entry is not None and entry[1] is not None and entry[1] <= time.time():
+        del databases[db][key]
+        return None
+    return entry
+
+def encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-ERR {reply}\r\n".encode()
+    if isinstance(reply, bool):
+        return b"+OK\r\n"
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(encode(item) for item in reply)
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+async def read_command(reader):
+    line = await reader.readuntil(b"\r\n")
+    if not line.startswith(b"*"):
+        # 内联命令（例如用telnet手动输入）
+        return line.strip().split()
+    command = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readuntil(b"\r\n"))[1:-2])
+        command.append((await reader.readexactly(length + 2))[:-2])
+    return command
+
+# 执行一条命令，返回回复；session记录当前连接选择的数据库和是否已经认证
+def execute(command, session):
+    name = command[0].decode().upper()
+    args = command[1:]
+    if name == "AUTH":
+        if settings["password"] is None or args[-1].decode() == settings["password"]:
+            session["authenticated"] = True
+            return True
+        return Exception("invalid password")
+    if settings["password"] is not None and not session["authenticated"]:
+        return Exception("NOAUTH Authentication required.")
+    db = session["db"]
+    if name == "PING":
+        return True
+    if name == "SELECT":
+        session["db"] = int(args[0])
+        return True
+    if name == "GET":
+        entry = get_entry(db, args[0])
+        return entry[0] if entry else None
+    if name == "MGET":
+        return [entry[0] if entry else None for entry in (get_entry(db, key) for key in args)]
+    if name == "SET":
+        expires_at = None
+        options = [arg.decode().upper() for arg in args[2:]]
+        if "PX" in options:
+            expires_at = time.time() + int(options[options.index("PX") + 1]) / 1000
+        elif "EX" in options:
+            expires_at = time.time() + int(options[options.index("EX") + 1])
+        databases.setdefault(db, {})[args[0]] = (args[1], expires_at)
+        return True
+    if name == "PTTL":
+        entry = get_entry(db, args[0])
+        if entry is None:
+            return -2
+        return -1 if entry[1] is None else max(0, int((entry[1] - time.time()) * 1000))
+    if name == "DEL":
+        return sum(1 for key in args if databases.setdefault(db, {}).pop(key, None) is not None)
+    if name == "FLUSHDB":
+        databases.pop(db, None)
+        return True
+    if name == "DBSIZE":
+        return len(databases.get(db, {}))
+    return Exception(f"unknown command '{name}'")
+
+async def handle_connection(reader, writer):
+    session = {"db": 0, "authenticated": False}
+    try:
+        while True:
+            command = await read_command(reader)
+            if command:
+                writer.write(encode(execute(command, session)))
+                await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port):
+    server = await asyncio.start_server(handle_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本地Redis模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--password", help="客户端需要先用AUTH认证")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    settings.update(password=args.password)
+    asyncio.run(serve(args.host, args.port))
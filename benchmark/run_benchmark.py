@@ -0,0 +1,197 @@
+"""
+/parse-douyin 离线压测：启动本地抖音模拟服务器（mock_douyin.py）和解析服务，
+把解析服务的所有上游请求指向模拟服务器，在不同并发数下统计每秒请求数和p50/p95/p99耗时。
+
+    python benchmark/run_benchmark.py --concurrency 1,8,32,64 --requests 500 --latency 0.05 --failure-rate 0.01
+
+默认关闭解析结果缓存和短链接映射，并且每个请求使用不同的短链接，测量的是完整的解析过程；
+加上--cache可以测量开启缓存后的表现。
+
+每次运行使用相同的短链接，可以先用--record录制一次上游响应，之后用--replay在相同的流量上比较不同版本；
+--replay-timing none 不等待上游耗时，只测量解析服务自身的CPU开销：
+
+    python benchmark/run_benchmark.py --record fixtures.jsonl
+    python benchmark/run_benchmark.py --replay fixtures.jsonl --replay-timing none
+"""
+import argparse
+import asyncio
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARK_DIR.parent
+API_KEY = "benchmark-key"
+
+# 解析服务使用的配置：上游请求全部发到模拟服务器
+def build_config(args):
+    http_client = {"upstream_override": f"http://127.0.0.1:{args.mock_port}"}
+    if args.record or args.replay:
+        http_client["record_replay"] = {
+            "mode": "record" if args.record else "replay",
+            "path": str(Path(args.record or args.replay).resolve()),
+            "replay_timing": args.replay_timing,
+        }
+    return {
+        "access_password": "benchmark",
+        "api_key": API_KEY,
+        "http_client": http_client,
+        "result_cache": {"enabled": args.cache},
+        "short_link_cache": {"enabled": args.cache, "path": "data/short_links.db"},
+        "logging": {"level": "WARNING"},
+    }
+
+# 启动子进程，输出写入工作目录中的日志文件
+def start_process(command, cwd, log_name):
+    log_file = open(Path(cwd) / log_name, "w", encoding="utf-8")
+    return subprocess.Popen(command, cwd=cwd, stdout=log_file, stderr=subprocess.STDOUT)
+
+# 等待服务可以访问
+async def wait_until_ready(client, url, timeout=20):
+    started_at = time.monotonic()
+    while time.monotonic() - started_at < timeout:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务没有在{timeout}秒内启动: {url}")
+
+# 按最近排名法计算百分位数
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+# 在指定并发数下发送total个解析请求，返回统计结果；run_id和并发数相同时使用的短链接也相同
+async def run_level(client, args, concurrency, total, run_id):
+    latencies = []
+    outcomes = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            short_link = f"https://v.douyin.com/{run_id}c{concurrency}n{index}/"
+            started_at = time.monotonic()
+            try:
+                response = await client.get(
+                    f"{args.app_url}/parse-douyin",
+                    params={"url": short_link, "verbosity": "lean"},
+                    headers={"X-API-Key": API_KEY},
+                )
+                outcome = response.json().get("status", "error") if response.status_code == 200 else f"http_{response.status_code}"
+            except (httpx.HTTPError, ValueError) as e:
+                outcome = type(e).__name__
+            latencies.append(time.monotonic() - started_at)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started_at = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started_at
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "outcomes": outcomes,
+    }
+
+def print_table(results):
+    print(f"{'并发':>6} {'请求数':>8} {'req/s':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}  结果")
+    for row in results:
+        outcomes = ", ".join(f"{name}={count}" for name, count in sorted(row["outcomes"].items()))
+        print(f"{row['concurrency']:>6} {row['requests']:>8} {row['rps']:>9} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}  {outcomes}")
+
+async def run_benchmark(args):
+    levels = [int(level) for level in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        if not args.replay:
+            await wait_until_ready(client, f"http://127.0.0.1:{args.mock_port}/")
+        await wait_until_ready(client, f"{args.app_url}/test")
+
+        # 预热：建立连接并加载解析服务中首次使用时才创建的对象
+        await run_level(client, args, min(levels), min(levels) * 2, "warmup")
+
+        results = []
+        for level in levels:
+            results.append(await run_level(client, args, level, args.requests, "run"))
+        return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="/parse-douyin 离线压测")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="并发数，多个用逗号分隔")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发级别发送的请求数")
+    parser.add_argument("--app-port", type=int, default=9200)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务器每个请求的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="模拟服务器延迟的随机波动范围（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟服务器返回503的比例")
+    parser.add_argument("--page-link-rate", type=float, default=1.0, help="视频页面中带有播放地址的比例")
+    parser.add_argument("--page-size", type=int, default=200 * 1024, help="视频页面的大致大小（字节）")
+    parser.add_argument("--cache", action="store_true", help="开启解析结果缓存和短链接映射")
+    parser.add_argument("--record", help="把上游响应录制到这个文件")
+    parser.add_argument("--replay", help="从这个文件回放上游响应，不启动模拟服务器")
+    parser.add_argument("--replay-timing", choices=["original", "none"], default="original", help="回放时按录制时的耗时等待，或者不等待")
+    parser.add_argument("--json", dest="json_output", help="把结果另外保存为JSON文件")
+    args = parser.parse_args(argv)
+    if args.record and args.replay:
+        parser.error("--record和--replay不能同时使用")
+    args.app_url = f"http://127.0.0.1:{args.app_port}"
+    return args
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="douyin-benchmark-") as work_dir:
+        # 解析服务在临时目录中运行，使用单独的配置文件和数据目录
+        (Path(work_dir) / "config").mkdir()
+        with open(Path(work_dir) / "config" / "api_config.json", "w", encoding="utf-8") as f:
+            json.dump(build_config(args), f, ensure_ascii=False, indent=2)
+
+        processes = []
+        if not args.replay:
+            processes.append(start_process([
+                sys.executable, str(BENCHMARK_DIR / "mock_douyin.py"),
+                "--port", str(args.mock_port),
+                "--latency", str(args.latency),
+                "--jitter", str(args.jitter),
+                "--failure-rate", str(args.failure_rate),
+                "--page-link-rate", str(args.page_link_rate),
+                "--page-size", str(args.page_size),
+            ], work_dir, "mock.log"))
+        processes.append(start_process([
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--app-dir", str(REPO_DIR),
+            "--port", str(args.app_port),
+            "--log-level", "warning",
+            "--no-access-log",
+        ], work_dir, "app.log"))
+        try:
+            results = asyncio.run(run_benchmark(args))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+    print_table(results)
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,36 @@
-from fastapi import FastAPI, Query, Request, Form, Depends, HTTPException, status, Cookie
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Query, Request, Form, Depends, HTTPException, status, Cookie, Header
+from fastapi.responses import JSONResponse, ORJSONResponse, HTMLResponse, RedirectResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import APIKeyHeader
-import requests
+import httpx
+import orjson
 import re
 import json
 import base64
+import hashlib
 import urllib.parse
+import urllib.request
 import os
 import time
 import random
 import uuid
+import asyncio
+import threading
+import sqlite3
+import socket
+import ipaddress
+import contextvars
+import logging
+import logging.handlers
+import queue
+import sys
+import atexit
+from http.cookiejar import DefaultCookiePolicy
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+from pydantic import BaseModel
 
 # 创建templates目录（如果不存在）
 templates_dir = Path("templates")
@@ -26,26 +43,183 @@ config_dir.mkdir(exist_ok=True)
 # 配置文件路径
 config_file = config_dir / "api_config.json"
 
+# 应用日志，在加载配置后由setup_logging设置输出方式
+logger = logging.getLogger("douyin_parser")
+
 # 默认配置
 default_config = {
     "access_password": "douyin123",
-    "api_key": "your_api_key_here"
+    "api_key": "your_api_key_here",
+    # 上游HTTP连接池配置（超时单位：秒）
+    "http_client": {
+        "connect_timeout": 5.0,
+        "read_timeout": 15.0,
+        "pool_timeout": 5.0,
+        "keepalive_expiry": 60.0,
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        # 每个上游域名单独的连接池，可以单独覆盖连接数
+        "hosts": {
+            "v.douyin.com": {},
+            "www.douyin.com": {},
+            "aweme.snssdk.com": {},
+        },
+        # 上游域名的DNS解析结果缓存时间（秒），0表示不缓存
+        "dns_cache_ttl": 300,
+        # 测试用：设置后所有上游请求都发到这个地址（例如benchmark中的本地模拟服务器），原来的域名保留在Host请求头中
+        "upstream_override": None,
+        # 录制/回放上游请求：mode为record时把真实的上游响应保存到path，为replay时只从path回放，不访问网络；
+        # replay_timing为original时按录制时的耗时回放，为none时立即返回
+        "record_replay": {
+            "mode": None,
+            "path": "data/fixtures/upstream.jsonl",
+            "replay_timing": "original",
+            "max_body_bytes": 4 * 1024 * 1024,
+        },
+    },
+    # 解析策略调度：sequential按顺序逐个尝试，race同时启动所有策略，hedge按对冲延迟（秒）错开启动
+    "resolver": {
+        "mode": "hedge",
+        "hedge_delay": 0.5,
+        # 同时进行中的策略数量上限
+        "max_fanout": 3,
+        "strategies": ["special_api", "mobile_html", "pc_html"],
+        # 根据最近stats_window次尝试的成功率和耗时自动调整策略顺序，成功率低于min_success_rate的策略跳过
+        "adaptive": True,
+        "stats_window": 50,
+        "min_samples": 5,
+        "min_success_rate": 0.1,
+        "explore_rate": 0.05,
+    },
+    # 解析结果缓存（时间单位：秒）：没有过期参数的链接使用default_ttl，有过期参数的提前expiry_margin过期
+    "result_cache": {
+        "enabled": True,
+        "default_ttl": 300,
+        "max_ttl": 3600,
+        "expiry_margin": 60,
+        "max_bytes": 16 * 1024 * 1024,
+    },
+    # 短链接到视频ID的持久化映射，重启后仍然有效；ttl是条目在共享缓存后端中的缓存时间（秒）。
+    # 无法写入path（例如只读的无服务器环境）时改为保存在内存中，最多占用max_bytes
+    "short_link_cache": {
+        "enabled": True,
+        "path": "data/short_links.db",
+        "ttl": 30 * 24 * 3600,
+        "max_bytes": 4 * 1024 * 1024,
+    },
+    # 共享缓存后端：type为redis时，解析结果缓存和短链接映射在本地缓存之外再写入Redis，供多台机器共用；
+    # 每次访问Redis最多等待timeout秒，Redis不可用时retry_interval秒内只使用本地缓存；
+    # 同时最多使用max_connections个连接，用完后保留pool_size个空闲连接复用
+    "cache_backend": {
+        "type": "memory",
+        "url": "redis://127.0.0.1:6379/0",
+        "key_prefix": "douyin:",
+        "timeout": 0.5,
+        "pool_size": 8,
+        "max_connections": 32,
+        "retry_interval": 30,
+    },
+    # 批量解析：单次请求的链接数上限和服务端同时解析的链接数
+    "batch": {
+        "max_links": 500,
+        "concurrency": 16,
+    },
+    # 单个链接的解析时间预算（秒）：客户端可以用deadline参数或X-Deadline请求头指定，限制在min和max之间
+    "deadline": {
+        "default": 20,
+        "min": 1,
+        "max": 60,
+    },
+    # 解析接口的返回内容：verbosity默认级别（lean只返回结果，default返回精简的调试信息，debug返回全部调试信息），
+    # 完整的调试信息保存在服务端最近debug_buffer_size次解析的环形缓冲区中，可以按request_id查询
+    "response": {
+        "verbosity": "default",
+        "debug_buffer_size": 1000,
+    },
+    # 日志：JSON行格式，file为空时输出到标准错误；日志在后台线程中格式化和写入，队列满时丢弃新的日志
+    "logging": {
+        "level": "INFO",
+        "file": None,
+        "queue_size": 10000,
+    },
+    # 启动预热：提前创建各个组件，解析上游域名并建立长连接，完成后/ready才返回就绪；最多等待timeout秒
+    "warmup": {
+        "enabled": True,
+        "hosts": ["v.douyin.com", "www.douyin.com", "aweme.snssdk.com", "v26-web.douyinvod.com"],
+        "timeout": 10,
+    },
+    # 多进程模式：配置（包括访问密码和API密钥）、解析结果缓存和监控指标保存在共享的SQLite数据库中，
+    # 各个进程每poll_interval秒检查一次配置是否被其他进程修改；workers为0时按CPU核数启动进程
+    "multi_worker": {
+        "enabled": False,
+        "workers": 0,
+        "path": "data/shared_state.db",
+        "poll_interval": 1.0,
+    },
+    # 异步任务：POST /jobs提交的链接保存在SQLite中，重启后继续解析；后台workers个协程逐个领取链接解析，
+    # 空闲时每poll_interval秒检查一次新链接；领取后lease_timeout秒仍未完成的链接（例如进程已退出）重新排队；
+    # 完成retention秒后的任务被删除（时间单位：秒）
+    "jobs": {
+        "enabled": True,
+        "path": "data/jobs.db",
+        "workers": 8,
+        "max_links": 50000,
+        "page_size": 100,
+        "max_page_size": 1000,
+        "poll_interval": 1.0,
+        "lease_timeout": 300,
+        "retention": 7 * 24 * 3600,
+    },
+    # 设备身份池：请求短链接时使用预热过的设备身份（UA和Cookie），并沿用服务端下发的Cookie
+    "identity_pool": {
+        "enabled": True,
+        "size": 8,                     # 池中保持的身份数量
+        "max_uses": 200,               # 每个身份最多使用的次数
+        "max_failures": 3,             # 连续失败多少次后淘汰
+        "max_age": 3600,               # 身份最长使用时间（秒）
+        "warm_interval": 30,           # 后台补充和预热身份的间隔（秒）
+        "warm_url": "https://www.douyin.com/",
+    },
+    # 熔断：按上游域名（douyin.com、iesdouyin.com、snssdk.com、douyinvod.com，其他域名共用other）和解析策略分别统计最近的调用，错误率或慢调用比例过高时暂停调用，直接失败
+    "circuit_breaker": {
+        "enabled": True,
+        "window": 20,                  # 统计最近多少次调用
+        "min_calls": 5,                # 至少多少次调用后才判断是否熔断
+        "error_rate": 0.5,             # 错误率达到该值时熔断
+        "slow_call_duration": 8.0,     # 耗时超过该值（秒）的调用算作慢调用
+        "slow_call_rate": 0.8,         # 慢调用比例达到该值时熔断
+        "open_seconds": 30,            # 熔断持续时间，之后进入半开状态试探
+        "half_open_max_calls": 1,      # 半开状态下同时允许的试探调用数
+    },
 }
 
+# 配置中一定存在的配置项，直接用CONFIG[...]读取
+REQUIRED_CONFIG_KEYS = ("access_password", "api_key")
+
 # 加载或创建配置
 def load_config():
     if config_file.exists():
         try:
             with open(config_file, "r", encoding="utf-8") as f:
-                return json.load(f)
+                config = json.load(f)
+            # 配置文件里没有访问密码或API密钥时使用默认值；其他配置项不放进配置，由get_settings读取时合并默认值，
+            # 保存配置时只会写入配置文件中原有的配置项
+            for key in REQUIRED_CONFIG_KEYS:
+                config.setdefault(key, default_config[key])
+            return config
         except Exception as e:
-            print(f"加载配置文件出错: {e}")
+            logger.error("加载配置文件出错: %s", e)
     
-    # 如果配置文件不存在或出错，创建默认配置
+    # 如果配置文件不存在或出错，创建只有访问密码和API密钥的默认配置
+    config = {key: default_config[key] for key in REQUIRED_CONFIG_KEYS}
     with open(config_file, "w", encoding="utf-8") as f:
-        json.dump(default_config, f, ensure_ascii=False, indent=2)
+        json.dump(config, f, ensure_ascii=False, indent=2)
     
-    return default_config
+    return config
+
+# 读取某一项配置，缺少的字段使用默认值
+def get_settings(section):
+    return {**default_config[section], **CONFIG.get(section, {})}
 
 # 保存配置
 def save_config(config):
@@ -55,6 +229,256 @@ def save_config(config):
 # 加载配置
 CONFIG = load_config()
 
+# 当前HTTP请求的关联ID，由中间件设置，写入这个请求处理过程中的每一条日志
+current_request_id = contextvars.ContextVar("current_request_id", default=None)
+# 当前正在进行的解析（ParseContext），日志中记录它的ID；在导入阶段输出的日志也会读取它，所以在这里定义
+current_parse = contextvars.ContextVar("current_parse", default=None)
+
+# 把日志记录格式化为一行JSON（在后台线程中执行）
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        if record.parse_id and record.parse_id != record.request_id:
+            entry["parse_id"] = record.parse_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+# 非阻塞的日志处理器：调用线程中只记下关联ID并把日志记录放入队列，消息的格式化和写入都在后台线程中进行
+class LogQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.request_id = current_request_id.get()
+        parse_context = current_parse.get()
+        record.parse_id = parse_context.request_id if parse_context is not None else None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# 设置应用日志：日志记录经过队列交给后台线程写入标准错误或日志文件
+def setup_logging(settings):
+    log_queue = queue.Queue(settings["queue_size"])
+    if settings["file"]:
+        Path(settings["file"]).parent.mkdir(parents=True, exist_ok=True)
+        target = logging.FileHandler(settings["file"], encoding="utf-8")
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(JsonLogFormatter())
+    listener = logging.handlers.QueueListener(log_queue, target)
+    listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+    
+    logger.handlers = [LogQueueHandler(log_queue)]
+    logger.setLevel(settings["level"].upper())
+    logger.propagate = False
+    return listener
+
+log_listener = setup_logging(get_settings("logging"))
+
+# 多进程共享状态：同一台机器上的所有进程打开同一个SQLite数据库（WAL模式，读写互不阻塞）
+class SharedState:
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS config ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS config_source ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), digest TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, size INTEGER NOT NULL, data TEXT NOT NULL, accessed_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS cache_entries_accessed_at ON cache_entries (accessed_at);"
+            "CREATE TABLE IF NOT EXISTS cache_usage ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), entries INTEGER NOT NULL, bytes INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO cache_usage (id, entries, bytes) VALUES (1, 0, 0);"
+            "CREATE TABLE IF NOT EXISTS worker_metrics ("
+            "worker_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, data TEXT NOT NULL);"
+        )
+        self.conn.commit()
+
+    # 返回(版本号, 配置)，还没有保存过配置时返回(0, None)
+    def load_config(self):
+        with self.lock:
+            row = self.conn.execute("SELECT version, data FROM config WHERE id = 1").fetchone()
+        return (row[0], json.loads(row[1])) if row else (0, None)
+
+    # 配置内容的摘要，用来判断配置文件是否被修改过
+    @staticmethod
+    def config_digest(config):
+        return hashlib.sha256(json.dumps(config, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # 用配置文件中的配置更新共享状态：还没有保存过配置，或者配置文件在上次写入后被修改过时写入并增加版本号；
+    # 多个进程同时启动时读到的是同一个文件，只有第一个进程会写入。返回是否写入
+    def seed_config(self, config):
+        digest = self.config_digest(config)
+        
+        def seed(conn):
+            row = conn.execute("SELECT digest FROM config_source WHERE id = 1").fetchone()
+            if row is not None and row[0] == digest:
+                return False
+            self._write_config(config, digest)
+            return True
+        return self._transaction(seed)
+
+    # 保存配置并增加版本号，返回新的版本号；配置同时会写入配置文件，记录它的摘要，重启时不会被当作文件修改
+    def save_config(self, config):
+        with self.lock:
+            self._write_config(config, self.config_digest(config))
+            self.conn.commit()
+            return self.conn.execute("SELECT version FROM config WHERE id = 1").fetchone()[0]
+
+    def _write_config(self, config, digest):
+        self.conn.execute(
+            "INSERT INTO config (id, version, data) VALUES (1, 1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET version = version + 1, data = excluded.data",
+            (json.dumps(config, ensure_ascii=False),),
+        )
+        self.conn.execute("INSERT OR REPLACE INTO config_source (id, digest) VALUES (1, ?)", (digest,))
+
+    def config_version(self):
+        with self.lock:
+            row = self.conn.execute("SELECT version FROM config WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    # 在一个事务中执行func(conn)，出错时回滚
+    def _transaction(self, func):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return result
+
+    # 删除缓存条目并更新条目数和总大小（在事务中调用）
+    @staticmethod
+    def _delete_cache_entries(conn, rows):
+        conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key, _ in rows])
+        conn.execute("UPDATE cache_usage SET entries = entries - ?, bytes = bytes - ? WHERE id = 1", (len(rows), sum(size for _, size in rows)))
+
+    # 批量读取缓存，返回({键: (过期时间, 数据)}, 过期删除的条目数)；命中的条目更新最近访问时间
+    def cache_get_many(self, keys, now):
+        def get(conn):
+            found = {}
+            expired = []
+            for key in keys:
+                row = conn.execute("SELECT expires_at, size, data FROM cache_entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                if row[0] <= now:
+                    expired.append((key, row[1]))
+                else:
+                    found[key] = (row[0], row[2])
+            if expired:
+                self._delete_cache_entries(conn, expired)
+            conn.executemany("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            return found, len(expired)
+        return self._transaction(get)
+
+    # 批量写入缓存[(键, 过期时间, 大小, 数据)]，总大小超过max_bytes时淘汰最久没有访问的条目，返回淘汰的条目数
+    def cache_set_many(self, items, max_bytes, now):
+        def set_many(conn):
+            for key, expires_at, size, data in items:
+                old = conn.execute("SELECT size FROM cache_entries WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, expires_at, size, data, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, expires_at, size, data, now),
+                )
+                conn.execute(
+                    "UPDATE cache_usage SET entries = entries + ?, bytes = bytes + ? WHERE id = 1",
+                    (0 if old else 1, size - (old[0] if old else 0)),
+                )
+            evicted = 0
+            total = conn.execute("SELECT bytes FROM cache_usage WHERE id = 1").fetchone()[0]
+            while total > max_bytes:
+                rows = conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at LIMIT 16").fetchall()
+                victims = []
+                for key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    victims.append((key, size))
+                    total -= size
+                self._delete_cache_entries(conn, victims)
+                evicted += len(victims)
+            return evicted
+        return self._transaction(set_many)
+
+    # 返回(条目数, 总大小)
+    def cache_summary(self):
+        with self.lock:
+            return self.conn.execute("SELECT entries, bytes FROM cache_usage WHERE id = 1").fetchone()
+
+    # 保存本进程的监控指标，供其他进程汇总
+    def publish_metrics(self, worker_id, data):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO worker_metrics (worker_id, updated_at, data) VALUES (?, ?, ?)",
+                (worker_id, time.time(), json.dumps(data)),
+            )
+            self.conn.commit()
+
+    # 返回最近max_age秒内更新过的各个进程的监控指标{进程ID: 指标}，并删除已经停止的进程留下的记录
+    def worker_metrics(self, max_age):
+        with self.lock:
+            self.conn.execute("DELETE FROM worker_metrics WHERE updated_at < ?", (time.time() - max_age,))
+            self.conn.commit()
+            rows = self.conn.execute("SELECT worker_id, data FROM worker_metrics").fetchall()
+        return {worker_id: json.loads(data) for worker_id, data in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+shared_state = SharedState(get_settings("multi_worker")["path"]) if get_settings("multi_worker")["enabled"] else None
+config_version = 0
+WORKER_ID = str(os.getpid())
+
+# 使用共享状态中的配置（版本号没有变化时不做任何事）
+def apply_shared_config(version, config):
+    global CONFIG, ACCESS_PASSWORD, API_KEY, config_version
+    if config is None or version == config_version:
+        return
+    CONFIG = config
+    ACCESS_PASSWORD = config["access_password"]
+    API_KEY = config["api_key"]
+    config_version = version
+    logger.info("已加载其他进程修改的配置（版本%s）", version)
+
+# 检查其他进程是否修改了配置，有修改时立即使用新的配置（在线程中读取数据库，不阻塞事件循环）。
+# 平时由后台任务watch_shared_state定期检查，这里只用于启动和修改配置之前
+async def refresh_shared_config():
+    if shared_state is not None and await asyncio.to_thread(shared_state.config_version) != config_version:
+        apply_shared_config(*await asyncio.to_thread(shared_state.load_config))
+
+# 多进程模式下，第一个启动的进程把配置文件中的配置写入共享状态（配置文件修改后重启时也会重新写入），
+# 之后所有进程都以共享状态为准
+if shared_state is not None:
+    if shared_state.seed_config(CONFIG):
+        logger.info("已把配置文件中的配置写入共享状态")
+    version, shared_config = shared_state.load_config()
+    CONFIG = shared_config
+    config_version = version
+
 app = FastAPI()
 
 # 设置模板目录
@@ -100,9 +524,6 @@ async def read_root(request: Request, authorized: bool = Depends(verify_access))
     if not authorized:
         return templates.TemplateResponse("login.html", {"request": request})
     
-    # 重新加载配置以确保最新
-    CONFIG = load_config()
-    
     return templates.TemplateResponse("index.html", {
         "request": request,
         "access_password": CONFIG["access_password"],
@@ -130,9 +551,6 @@ async def admin_panel(request: Request, is_admin: bool = Depends(verify_admin)):
     if not is_admin:
         return templates.TemplateResponse("login.html", {"request": request, "error": "请先登录"})
     
-    # 重新加载配置以确保最新
-    CONFIG = load_config()
-    
     return templates.TemplateResponse("admin.html", {
         "request": request,
         "access_password": CONFIG["access_password"],
@@ -152,16 +570,21 @@ async def update_config(
     if not is_admin:
         return templates.TemplateResponse("login.html", {"request": request, "error": "请先登录"})
     
-    # 更新配置
+    # 更新配置（多进程模式下先同步其他进程的修改，避免覆盖）；文件和数据库都在线程中写入，不阻塞事件循环
+    await refresh_shared_config()
     CONFIG["access_password"] = access_password
     CONFIG["api_key"] = api_key
-    save_config(CONFIG)
+    await asyncio.to_thread(save_config, CONFIG)
     
     # 更新全局变量
-    global ACCESS_PASSWORD, API_KEY
+    global ACCESS_PASSWORD, API_KEY, config_version
     ACCESS_PASSWORD = access_password
     API_KEY = api_key
     
+    # 多进程模式下写入共享状态，其他进程会在下一次检查时使用新的配置
+    if shared_state is not None:
+        config_version = await asyncio.to_thread(shared_state.save_config, CONFIG)
+    
     # 重定向回管理面板
     response = RedirectResponse(url="/admin", status_code=status.HTTP_302_FOUND)
     
@@ -184,8 +607,17 @@ def api_info(authorized: bool = Depends(verify_access)):
         "endpoints": {
             "/": "中文网页界面，方便直接使用",
             "/parse-douyin": "解析抖音视频链接，获取下载地址",
+            "/parse-douyin/batch": "批量解析抖音视频链接（POST，JSON格式：{\"urls\": [...]}）",
+            "/parse-douyin/stream": "流式批量解析，每解析完一个链接输出一行NDJSON（?format=sse 输出SSE事件）",
+            "/debug/{request_id}": "按解析结果中的request_id查询完整的调试信息",
             "/api": "当前API信息页面",
-            "/admin": "管理员设置面板"
+            "/admin": "管理员设置面板",
+            "/admin/breakers": "上游域名和解析策略的熔断状态（需要管理员登录）",
+            "/ready": "就绪检查，启动预热完成后返回200",
+            "/stats/pool": "上游连接池统计",
+            "/stats/cache": "解析结果缓存统计",
+            "/stats/strategies": "解析策略成功率和耗时统计",
+            "/metrics": "Prometheus格式的监控指标"
         },
         "usage": f"访问 /parse-douyin?url=抖音链接 来解析视频，需要在请求头中添加 X-API-Key: {API_KEY}"
     }
@@ -203,9 +635,733 @@ def generate_api_key(authorized: bool = Depends(verify_admin)):
     
     return {"api_key": new_key}
 
+# 监控指标：以Prometheus文本格式输出的计数器和直方图
+class MetricsRegistry:
+    # 直方图的分桶（秒）
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.descriptions = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def describe(self, name, metric_type, help_text):
+        self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    # 导出计数器和直方图，用于多进程模式下汇总各个进程的指标
+    def export(self):
+        with self.lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, labels, histogram] for (name, labels), histogram in self.histograms.items()],
+            }
+
+    # 把export导出的指标累加到当前对象
+    def merge(self, exported):
+        with self.lock:
+            for name, labels, value in exported["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, other in exported["histograms"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0}
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], other["buckets"])]
+                histogram["sum"] += other["sum"]
+                histogram["count"] += other["count"]
+
+    # current_values是抓取时从各个统计对象读取的当前值：[(指标名, 标签, 值)]
+    def render(self, current_values):
+        samples = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), histogram in self.histograms.items():
+                series = samples.setdefault(name, [])
+                for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                    series.append((f"{name}_bucket", labels + (("le", str(bound)),), count))
+                series.append((f"{name}_bucket", labels + (("le", "+Inf"),), histogram["count"]))
+                series.append((f"{name}_sum", labels, histogram["sum"]))
+                series.append((f"{name}_count", labels, histogram["count"]))
+        for name, labels, value in current_values:
+            samples.setdefault(name, []).append((name, tuple(sorted(labels.items())), value))
+
+        lines = []
+        for name, series in samples.items():
+            metric_type, help_text = self.descriptions.get(name, ("gauge", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in series:
+                label_str = ",".join(f'{key}="{escape_label_value(val)}"' for key, val in labels)
+                lines.append(f"{sample_name}{{{label_str}}} {value}" if label_str else f"{sample_name} {value}")
+        return "\n".join(lines) + "\n"
+
+# 转义Prometheus标签值中的反斜杠、双引号和换行
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = MetricsRegistry()
+metrics.describe("douyin_http_requests_total", "counter", "Requests handled, by endpoint and status code")
+metrics.describe("douyin_http_request_duration_seconds", "histogram", "Request latency by endpoint")
+metrics.describe("douyin_http_requests_in_flight", "gauge", "Requests currently being handled")
+metrics.describe("douyin_resolve_total", "counter", "Video resolutions by method")
+metrics.describe("douyin_resolve_duration_seconds", "histogram", "Video resolution latency by method")
+metrics.describe("douyin_strategy_duration_seconds", "histogram", "Resolution strategy latency by strategy and outcome")
+metrics.describe("douyin_upstream_requests_total", "counter", "Upstream requests by host and status code")
+metrics.describe("douyin_upstream_request_duration_seconds", "histogram", "Upstream request latency (until response headers) by host")
+metrics.describe("douyin_pool_requests_total", "counter", "Upstream requests by host and connection pool outcome")
+metrics.describe("douyin_fetch_memo_hits_total", "counter", "Upstream requests answered by an earlier identical request in the same parse")
+metrics.describe("douyin_cache_events_total", "counter", "Cache events by cache and event")
+metrics.describe("douyin_cache_entries", "gauge", "Entries currently stored, by cache")
+metrics.describe("douyin_result_cache_bytes", "gauge", "Approximate size of the result cache")
+metrics.describe("douyin_cache_backend_up", "gauge", "Whether the shared cache backend is in use, by cache (1 up, 0 local only)")
+metrics.describe("douyin_cache_backend_errors_total", "counter", "Shared cache backend errors, by cache")
+metrics.describe("douyin_job_items_total", "counter", "Links resolved by background jobs, by status")
+metrics.describe("douyin_job_items", "gauge", "Links stored in background jobs, by state")
+metrics.describe("douyin_single_flight_in_flight", "gauge", "Distinct video IDs currently being resolved")
+metrics.describe("douyin_strategy_success_rate", "gauge", "Success rate of each strategy over the sliding window")
+metrics.describe("douyin_circuit_breaker_open", "gauge", "Circuit breaker state by kind and name (0 closed, 1 open, 0.5 half-open)")
+metrics.describe("douyin_circuit_breaker_rejections_total", "counter", "Calls rejected by an open circuit breaker, by kind and name")
+
+http_requests_in_flight = 0
+
+# 客户端可以通过X-Request-ID请求头指定关联ID，格式不合法或没有指定时自动生成
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    token = current_request_id.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        current_request_id.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    global http_requests_in_flight
+    http_requests_in_flight += 1
+    started_at = time.monotonic()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        http_requests_in_flight -= 1
+        # 使用路由模板作为标签，避免把查询参数或路径参数展开成大量时间序列
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.inc("douyin_http_requests_total", {"path": path, "status": status_code})
+        metrics.observe("douyin_http_request_duration_seconds", {"path": path}, time.monotonic() - started_at)
+
+# 抖音自己的页面域名：只有这些域名返回的页面数据是可信的
+DOUYIN_PAGE_DOMAINS = ("douyin.com", "iesdouyin.com")
+
+# 链接的域名（小写），无法解析时返回空字符串
+def url_host(url):
+    try:
+        return httpx.URL(url).host
+    except (httpx.InvalidURL, TypeError):
+        return ""
+
+# 判断域名是否是domains中的某个域名或者它的子域名
+def host_in_domains(host, domains):
+    host = (host or "").lower().rstrip(".")
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+# 判断链接是否是抖音视频CDN（douyinvod.com）的地址，按解析出的域名判断，不匹配路径或参数中的文字
+def is_douyinvod_url(url):
+    return bool(url) and host_in_domains(url_host(url), ("douyinvod.com",))
+
+# 统计上游请求时区分的域名，其他域名都归入"other"
+UPSTREAM_METRIC_DOMAINS = ("douyin.com", "iesdouyin.com", "snssdk.com", "douyinvod.com")
+
+# 上游域名在统计中的名称：请求的域名由调用方提供，按所属的域名归类，避免统计项无限增长
+def upstream_host_label(host):
+    for domain in UPSTREAM_METRIC_DOMAINS:
+        if host_in_domains(host, (domain,)):
+            return domain
+    return "other"
+
+# 熔断器：关闭状态下统计最近的调用，错误率或慢调用比例超过阈值时打开；打开状态下直接拒绝调用，
+# 经过open_seconds后进入半开状态，放行少量试探调用，试探成功则关闭，失败则重新打开
+class CircuitBreaker:
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.calls = deque(maxlen=settings["window"])
+        self.opened_at = None
+        self.half_open_calls = 0
+        self.counters = {"opened": 0, "rejected": 0}
+
+    # 是否允许本次调用；返回True后必须调用record或release
+    def allow(self):
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.settings["open_seconds"]:
+                    self.counters["rejected"] += 1
+                    return False
+                self.state = "half_open"
+                self.half_open_calls = 0
+            if self.state == "half_open":
+                if self.half_open_calls >= self.settings["half_open_max_calls"]:
+                    self.counters["rejected"] += 1
+                    return False
+                self.half_open_calls += 1
+            return True
+
+    # 记录一次调用的结果和耗时
+    def record(self, success, latency):
+        slow = latency >= self.settings["slow_call_duration"]
+        with self.lock:
+            if self.state == "half_open":
+                self.half_open_calls = max(0, self.half_open_calls - 1)
+                if success and not slow:
+                    self.state = "closed"
+                    self.calls.clear()
+                else:
+                    self._trip()
+                return
+            if self.state == "open":
+                # 熔断前发出的调用在熔断后才返回，不再计入统计
+                return
+            self.calls.append((success, slow))
+            if len(self.calls) < self.settings["min_calls"]:
+                return
+            error_rate = sum(1 for ok, _ in self.calls if not ok) / len(self.calls)
+            slow_rate = sum(1 for _, is_slow in self.calls if is_slow) / len(self.calls)
+            if error_rate >= self.settings["error_rate"] or slow_rate >= self.settings["slow_call_rate"]:
+                self._trip()
+
+    # 调用被取消，没有结果：只归还半开状态的试探名额
+    def release(self):
+        with self.lock:
+            if self.state == "half_open":
+                self.half_open_calls = max(0, self.half_open_calls - 1)
+
+    def _trip(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.calls.clear()
+        self.counters["opened"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            calls = len(self.calls)
+            summary = {
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(sum(1 for ok, _ in self.calls if not ok) / calls, 4) if calls else None,
+                "slow_rate": round(sum(1 for _, is_slow in self.calls if is_slow) / calls, 4) if calls else None,
+                **self.counters,
+            }
+            if self.state == "open":
+                summary["retry_in"] = round(max(0, self.opened_at + self.settings["open_seconds"] - time.monotonic()), 3)
+            return summary
+
+# 按类型（host/strategy）和名称管理熔断器，首次使用时创建
+class CircuitBreakers:
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    # 返回对应的熔断器，关闭熔断功能时返回None
+    def get(self, kind, name):
+        if not self.settings["enabled"]:
+            return None
+        with self.lock:
+            breaker = self.breakers.get((kind, name))
+            if breaker is None:
+                breaker = self.breakers[(kind, name)] = CircuitBreaker(self.settings)
+            return breaker
+
+    def snapshot(self):
+        with self.lock:
+            breakers = list(self.breakers.items())
+        result = {}
+        for (kind, name), breaker in breakers:
+            result.setdefault(kind, {})[name] = breaker.snapshot()
+        return result
+
+circuit_breakers = None
+
+# 获取熔断器（首次使用时创建）
+def get_circuit_breakers():
+    global circuit_breakers
+    if circuit_breakers is None:
+        circuit_breakers = CircuitBreakers(get_settings("circuit_breaker"))
+    return circuit_breakers
+
+# 上游域名熔断时直接抛出的异常，和网络错误一样由调用方处理
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+# 带统计的上游传输层：记录每个域名的请求数以及连接池命中/未命中次数
+class MeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, stats):
+        self.transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        connected = []
+
+        # httpcore在新建TCP连接时会触发connect_tcp事件，没有触发说明复用了连接池中的连接
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.started":
+                connected.append(True)
+
+        # 该域名已经熔断时不发出请求，直接失败；熔断器和统计一样按所属的域名归类
+        host_label = upstream_host_label(request.url.host)
+        breaker = get_circuit_breakers().get("host", host_label)
+        if breaker is not None and not breaker.allow():
+            metrics.inc("douyin_circuit_breaker_rejections_total", {"kind": "host", "name": host_label})
+            raise CircuitOpenError(f"{host_label}已熔断", request=request)
+        
+        request.extensions = {**request.extensions, "trace": trace}
+        started_at = time.monotonic()
+        status_code = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status_code = response.status_code
+            return response
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.release()
+                breaker = None
+            raise
+        finally:
+            # 网络错误、5xx和429（限流）算作失败
+            if breaker is not None:
+                success = status_code != "error" and status_code < 500 and status_code != 429
+                breaker.record(success, time.monotonic() - started_at)
+            self.stats.record(host_label, bool(connected))
+            metrics.inc("douyin_upstream_requests_total", {"host": host_label, "status": status_code})
+            metrics.observe("douyin_upstream_request_duration_seconds", {"host": host_label}, time.monotonic() - started_at)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+# 把请求改发到指定地址的传输层，请求头（包括Host）保持不变，响应中的URL仍是原来的地址
+class UpstreamOverrideTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, base_url):
+        self.transport = transport
+        self.base_url = httpx.URL(base_url)
+
+    async def handle_async_request(self, request):
+        url = request.url.copy_with(scheme=self.base_url.scheme, host=self.base_url.host, port=self.base_url.port)
+        forwarded = httpx.Request(request.method, url, headers=request.headers, stream=request.stream, extensions=request.extensions)
+        return await self.transport.handle_async_request(forwarded)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+# DNS缓存：保存上游域名解析到的地址，过期后重新解析，连接失败时清除
+class DnsCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.counters = {"hits": 0, "misses": 0}
+
+    async def resolve(self, host, port):
+        entry = self.entries.get(host)
+        if entry is not None and entry[0] > time.monotonic():
+            self.counters["hits"] += 1
+            return entry[1]
+        self.counters["misses"] += 1
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self.entries[host] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    # 把连接失败的地址移到最后，之后的请求先尝试其他地址
+    def demote(self, host, address):
+        entry = self.entries.get(host)
+        if entry is not None and address in entry[1]:
+            entry[1].remove(address)
+            entry[1].append(address)
+
+    def invalidate(self, host):
+        self.entries.pop(host, None)
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            **self.counters,
+            "hosts": {
+                host: {"addresses": addresses, "expires_in": round(expires_at - now, 1)}
+                for host, (expires_at, addresses) in self.entries.items()
+            },
+        }
+
+# 使用DNS缓存的传输层：把请求发到缓存的IP地址，Host请求头和TLS的SNI仍然使用原来的域名
+class ResolvingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, dns_cache):
+        self.transport = transport
+        self.dns_cache = dns_cache
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        try:
+            ipaddress.ip_address(host)
+            return await self.transport.handle_async_request(request)
+        except ValueError:
+            pass
+        try:
+            addresses = await self.dns_cache.resolve(host, request.url.port or (443 if request.url.scheme == "https" else 80))
+        except OSError:
+            # 解析失败时交给底层传输层自己解析，由它抛出对应的网络错误
+            return await self.transport.handle_async_request(request)
+        # 依次尝试解析到的各个地址，连接失败的地址移到最后；所有地址都连接失败时清除缓存，下次重新解析
+        for address in list(addresses):
+            forwarded = httpx.Request(
+                request.method,
+                request.url.copy_with(host=address),
+                headers=request.headers,
+                stream=request.stream,
+                extensions={**request.extensions, "sni_hostname": host},
+            )
+            try:
+                return await self.transport.handle_async_request(forwarded)
+            except httpx.ConnectError as e:
+                logger.debug("连接%s（%s）失败: %s", host, address, e)
+                self.dns_cache.demote(host, address)
+                error = e
+        self.dns_cache.invalidate(host)
+        raise error
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+# 上游请求的录制文件：每行一个JSON，记录请求、响应头、响应内容（base64）以及响应头和内容各自的耗时。
+# 回放时按方法和规范化后的URL（去掉防缓存参数）查找，同一个请求录制了多次时依次循环使用
+class UpstreamRecorder:
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.file = None
+        self.exchanges = {}
+        self.cursors = {}
+        if settings["mode"] == "replay":
+            with open(settings["path"], "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        self.exchanges.setdefault((exchange["method"], exchange["key"]), []).append(exchange)
+
+    def record(self, exchange):
+        line = json.dumps(exchange, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                Path(self.settings["path"]).parent.mkdir(parents=True, exist_ok=True)
+                self.file = open(self.settings["path"], "a", encoding="utf-8")
+            self.file.write(line)
+            self.file.flush()
+
+    def find(self, method, key):
+        with self.lock:
+            exchanges = self.exchanges.get((method, key))
+            if not exchanges:
+                return None
+            cursor = self.cursors.get((method, key), 0)
+            self.cursors[(method, key)] = cursor + 1
+            return exchanges[cursor % len(exchanges)]
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+# 回放的响应内容：分块返回，按原始耗时回放时把读取内容的时间平均分到每一块
+class ReplayStream(httpx.AsyncByteStream):
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, body, delay):
+        self.body = body
+        self.delay = delay
+
+    async def __aiter__(self):
+        chunks = [self.body[i:i + self.CHUNK_SIZE] for i in range(0, len(self.body), self.CHUNK_SIZE)]
+        for chunk in chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay / len(chunks))
+            yield chunk
+
+# 录制/回放传输层：录制时完整读取上游响应（超过max_body_bytes的部分丢弃）并保存，回放时不访问网络
+class RecordReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    async def handle_async_request(self, request):
+        if self.recorder.settings["mode"] == "replay":
+            return await self._replay(request)
+        return await self._record(request)
+
+    async def _record(self, request):
+        started_at = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        headers_elapsed = time.monotonic() - started_at
+        body = bytearray()
+        truncated = False
+        try:
+            async for chunk in response.aiter_raw():
+                body += chunk
+                if len(body) > self.recorder.settings["max_body_bytes"]:
+                    del body[self.recorder.settings["max_body_bytes"]:]
+                    truncated = True
+                    break
+        finally:
+            await response.aclose()
+        self.recorder.record({
+            "method": request.method,
+            "url": str(request.url),
+            "key": normalize_upstream_url(str(request.url)),
+            "status": response.status_code,
+            "headers": [[name, value] for name, value in response.headers.multi_items()],
+            "body": base64.b64encode(bytes(body)).decode("ascii"),
+            "truncated": truncated,
+            "headers_elapsed": round(headers_elapsed, 6),
+            "body_elapsed": round(time.monotonic() - started_at - headers_elapsed, 6),
+        })
+        return httpx.Response(response.status_code, headers=response.headers, stream=ReplayStream(bytes(body), 0), extensions=response.extensions)
+
+    async def _replay(self, request):
+        exchange = self.recorder.find(request.method, normalize_upstream_url(str(request.url)))
+        if exchange is None:
+            raise httpx.ConnectError(f"没有录制的响应: {request.method} {request.url}", request=request)
+        original_timing = self.recorder.settings["replay_timing"] == "original"
+        if original_timing:
+            await asyncio.sleep(exchange["headers_elapsed"])
+        body = base64.b64decode(exchange["body"])
+        return httpx.Response(
+            exchange["status"],
+            headers=exchange["headers"],
+            stream=ReplayStream(body, exchange["body_elapsed"] if original_timing else 0),
+        )
+
+    async def aclose(self):
+        if self.transport is not None:
+            await self.transport.aclose()
+
+# 连接池统计
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def record(self, host, new_connection):
+        with self.lock:
+            host_stats = self.hosts.setdefault(host, {"requests": 0, "pool_hits": 0, "pool_misses": 0})
+            host_stats["requests"] += 1
+            if new_connection:
+                host_stats["pool_misses"] += 1
+            else:
+                host_stats["pool_hits"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {host: dict(host_stats) for host, host_stats in self.hosts.items()}
+
+# 读取代理环境变量，返回({"http": 代理地址, "https": 代理地址}, NO_PROXY中的域名模式列表)，没有配置代理的协议不在其中
+def environment_proxies():
+    env = urllib.request.getproxies_environment()
+    proxies = {}
+    for scheme in ("http", "https"):
+        proxy = env.get(scheme) or env.get("all")
+        if proxy:
+            proxies[scheme] = proxy if "://" in proxy else f"http://{proxy}"
+    no_proxy = []
+    for host in env.get("no", "").split(","):
+        host = host.strip().lstrip(".")
+        if host == "*":
+            return {}, []
+        if not host:
+            continue
+        # 和httpx一样：IP地址和localhost只匹配它自己，域名同时匹配它的子域名
+        try:
+            address = ipaddress.ip_address(host)
+            no_proxy.append(f"[{host}]" if address.version == 6 else host)
+        except ValueError:
+            no_proxy.append(host if host == "localhost" else f"*{host}")
+    return proxies, no_proxy
+
+# 共享的上游HTTP客户端：每个上游域名一个长连接池
+class UpstreamClient:
+    def __init__(self, settings):
+        self.settings = settings
+        self.stats = PoolStats()
+        record_replay = {**default_config["http_client"]["record_replay"], **(settings.get("record_replay") or {})}
+        self.recorder = UpstreamRecorder(record_replay) if record_replay["mode"] in ("record", "replay") else None
+        # 请求发到固定地址或者只回放录制内容时不需要解析域名
+        use_dns_cache = settings["dns_cache_ttl"] > 0 and not settings.get("upstream_override") and record_replay["mode"] != "replay"
+        self.dns_cache = DnsCache(settings["dns_cache_ttl"]) if use_dns_cache else None
+
+        # 传入transport后httpx不再读取代理环境变量，这里按HTTP_PROXY/HTTPS_PROXY/ALL_PROXY为每个协议挂载走代理的传输层，
+        # NO_PROXY中的域名直接连接；请求发到固定地址或者只回放录制内容时不使用代理
+        use_proxies = not settings.get("upstream_override") and record_replay["mode"] != "replay"
+        proxies, no_proxy = environment_proxies() if use_proxies else ({}, [])
+        mounts = {}
+        for scheme, proxy in proxies.items():
+            mounts[f"{scheme}://"] = self._build_transport(settings, proxy)
+        for host in no_proxy:
+            mounts[f"all://{host}"] = self._build_transport(settings)
+        for host, host_settings in settings.get("hosts", {}).items():
+            host_settings = {**settings, **(host_settings or {})}
+            mounts[f"all://{host}"] = self._build_transport(host_settings)
+            if not urllib.request.proxy_bypass_environment(host):
+                for scheme, proxy in proxies.items():
+                    mounts[f"{scheme}://{host}"] = self._build_transport(host_settings, proxy)
+
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings["read_timeout"],
+                connect=settings["connect_timeout"],
+                pool=settings["pool_timeout"],
+            ),
+            transport=self._build_transport(settings),
+            mounts=mounts,
+            # 每个请求都带自己的Cookie，不在共享客户端上保存服务端下发的Cookie
+            cookies=httpx.Cookies(),
+        )
+        self.client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    # proxy是代理地址，走代理时由代理服务器解析域名，不使用DNS缓存
+    def _build_transport(self, settings, proxy=None):
+        limits = httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        )
+        if self.recorder is not None and self.recorder.settings["mode"] == "replay":
+            return MeteredTransport(RecordReplayTransport(None, self.recorder), self.stats)
+        transport = httpx.AsyncHTTPTransport(limits=limits, proxy=proxy)
+        if settings.get("upstream_override"):
+            transport = UpstreamOverrideTransport(transport, settings["upstream_override"])
+        elif self.dns_cache is not None and proxy is None:
+            transport = ResolvingTransport(transport, self.dns_cache)
+        if self.recorder is not None:
+            transport = RecordReplayTransport(transport, self.recorder)
+        return MeteredTransport(transport, self.stats)
+
+    # 按本次解析剩余的时间预算缩短连接和读取超时，预算用完时不再发起请求
+    def timeout_for_current_parse(self):
+        parse_context = current_parse.get()
+        if parse_context is None or parse_context.deadline is None:
+            return self.client.timeout
+        remaining = parse_context.deadline - time.monotonic()
+        if remaining <= 0:
+            raise httpx.TimeoutException("解析时间预算已用完")
+        return httpx.Timeout(
+            min(self.settings["read_timeout"], remaining),
+            connect=min(self.settings["connect_timeout"], remaining),
+            pool=min(self.settings["pool_timeout"], remaining),
+        )
+
+    async def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout_for_current_parse())
+        return await self.client.get(url, **kwargs)
+
+    # 流式请求，返回async with使用的上下文管理器
+    def stream(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout_for_current_parse())
+        return self.client.stream(method, url, **kwargs)
+
+    # 逐跳跟踪重定向，只读取响应头，不下载响应内容；下一跳的域名包含stop_host时直接返回该链接，不再请求它。
+    # 返回(最终URL, 重定向历史, 最后一次响应的状态码)
+    async def resolve_redirects(self, url, headers=None, stop_host="douyinvod.com", max_hops=10):
+        history = []
+        status_code = None
+        for _ in range(max_hops):
+            if stop_host and host_in_domains(httpx.URL(url).host, (stop_host,)):
+                return url, history, status_code
+            request = self.client.build_request("GET", url, headers=headers, timeout=self.timeout_for_current_parse())
+            response = await self.client.send(request, stream=True)
+            try:
+                status_code = response.status_code
+                if not response.is_redirect:
+                    return url, history, status_code
+                next_url = str(response.url.join(response.headers["Location"]))
+            finally:
+                await self._release(response)
+            history.append(url)
+            url = next_url
+        raise httpx.TooManyRedirects(f"超过{max_hops}次重定向: {url}")
+
+    # 释放流式响应：内容很小时读完以便连接回到连接池复用，否则不读取内容直接关闭连接
+    async def _release(self, response):
+        content_length = response.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) <= 64 * 1024:
+            await response.aread()
+        await response.aclose()
+
+    # 预热用：向url发送HEAD请求，建立的连接留在连接池中
+    async def warm_connection(self, url):
+        response = await self.client.head(url, timeout=self.timeout_for_current_parse())
+        return response.status_code
+
+    async def aclose(self):
+        await self.client.aclose()
+        if self.recorder is not None:
+            self.recorder.close()
+
+http_client = None
+http_client_lock = threading.Lock()
+
+# 获取共享的上游HTTP客户端（首次使用时创建）
+def get_http_client():
+    global http_client
+    if http_client is None:
+        with http_client_lock:
+            if http_client is None:
+                http_client = UpstreamClient(get_settings("http_client"))
+    return http_client
+
+@app.get("/stats/pool")
+def pool_stats(authorized: bool = Depends(verify_access)):
+    """
+    上游连接池统计：按上游域名（douyin.com、iesdouyin.com、snssdk.com、douyinvod.com，其他域名归入other）统计的请求数、连接复用（命中）和新建连接（未命中）次数，以及设备身份池的状态。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    client = get_http_client()
+    return {
+        "settings": client.settings,
+        "hosts": client.stats.snapshot(),
+        "dns_cache": client.dns_cache.snapshot() if client.dns_cache is not None else None,
+        "identities": get_identity_pool().snapshot()
+    }
+
 # 生成随机设备ID
 def generate_device_id():
-    return ''.join([str(random.randint(0, 9)) for _ in range(16)])
+    return f"{random.randrange(10 ** 16):016d}"
 
 # 生成随机的抖音Cookie
 def generate_douyin_cookies():
@@ -228,23 +1384,19 @@ def generate_douyin_cookies():
 
 # 将Cookie字典转换为Cookie字符串
 def cookies_to_string(cookies):
-    result = ""
-    for domain, domain_cookies in cookies.items():
-        for name, value in domain_cookies.items():
-            result += f"{name}={value}; "
-    return result.strip()
+    return "; ".join(f"{name}={value}" for domain_cookies in cookies.values() for name, value in domain_cookies.items())
 
 # 从URL中提取视频ID
+VIDEO_ID_PATTERNS = [
+    re.compile(r'/video/(\d+)'),
+    re.compile(r'modal_id=(\d+)'),
+    re.compile(r'item_ids=(\d+)'),
+    re.compile(r'vid=(\d+)'),  # 添加对海外访问链接格式的支持
+]
+
 def extract_video_id(url):
-    patterns = [
-        r'/video/(\d+)',
-        r'modal_id=(\d+)',
-        r'item_ids=(\d+)',
-        r'vid=(\d+)'  # 添加对海外访问链接格式的支持
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, str(url))
+    for pattern in VIDEO_ID_PATTERNS:
+        match = pattern.search(str(url))
         if match:
             return match.group(1)
     return None
@@ -260,6 +1412,126 @@ def get_mobile_ua():
     ]
     return random.choice(mobile_uas)
 
+# 设备身份：一个客户端固定使用的UA和Cookie，服务端下发的Cookie会保存下来在之后的请求中继续使用
+class DeviceIdentity:
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.user_agent = get_mobile_ua()
+        self.cookies = dict(generate_douyin_cookies()["douyin.com"])
+        self.created_at = time.time()
+        self.uses = 0
+        self.failures = 0
+        self.warmed = False
+
+    def cookie_header(self):
+        return cookies_to_string({"douyin.com": self.cookies})
+
+    # 保存响应（包括重定向过程中的各个响应）中Set-Cookie下发的Cookie，值为空表示删除；
+    # 只接受抖音域名下发的Cookie，其他网站不能改写身份的Cookie
+    def absorb(self, response):
+        for each in [*response.history, response]:
+            if not host_in_domains(each.url.host, DOUYIN_PAGE_DOMAINS):
+                continue
+            for header in each.headers.get_list("set-cookie"):
+                name, _, value = header.split(";", 1)[0].partition("=")
+                name, value = name.strip(), value.strip()
+                if not name:
+                    continue
+                if value:
+                    self.cookies[name] = value
+                else:
+                    self.cookies.pop(name, None)
+
+# 设备身份池：轮流使用池中的身份，后台定期补足身份数量并访问首页获取服务端Cookie（预热）；
+# 连续失败、使用次数过多或存在时间过长的身份会被淘汰并由新身份替换
+class IdentityPool:
+    def __init__(self, settings):
+        self.settings = settings
+        self.identities = deque()
+        self.counters = {"created": 0, "retired": 0, "warmed": 0, "warm_failures": 0}
+
+    def _create(self):
+        identity = DeviceIdentity()
+        self.identities.append(identity)
+        self.counters["created"] += 1
+        return identity
+
+    def _expired(self, identity):
+        return (
+            identity.failures >= self.settings["max_failures"]
+            or identity.uses >= self.settings["max_uses"]
+            or time.time() - identity.created_at >= self.settings["max_age"]
+        )
+
+    # 取出下一个身份，池为空时立即创建一个（未预热的）身份
+    def acquire(self):
+        if not self.identities:
+            return self._create()
+        identity = self.identities[0]
+        self.identities.rotate(-1)
+        return identity
+
+    # 记录一次使用的结果，需要淘汰时用新身份替换
+    def report(self, identity, success):
+        identity.uses += 1
+        identity.failures = 0 if success else identity.failures + 1
+        if self._expired(identity):
+            self.retire(identity)
+
+    def retire(self, identity):
+        if identity in self.identities:
+            self.identities.remove(identity)
+            self.counters["retired"] += 1
+            self._create()
+
+    # 用身份访问预热地址，只读取响应头中的Cookie
+    async def warm(self, identity):
+        headers = {**build_browser_headers(identity.user_agent), 'Cookie': identity.cookie_header()}
+        try:
+            async with get_http_client().stream("GET", self.settings["warm_url"], headers=headers) as response:
+                identity.absorb(response)
+            identity.warmed = True
+            self.counters["warmed"] += 1
+        except httpx.HTTPError as e:
+            logger.debug("预热设备身份%s失败: %s", identity.id, e)
+            self.counters["warm_failures"] += 1
+            self.report(identity, False)
+
+    # 淘汰过期的身份，补足数量并预热还没有预热的身份
+    async def fill(self):
+        for identity in list(self.identities):
+            if self._expired(identity):
+                self.retire(identity)
+        while len(self.identities) < self.settings["size"]:
+            self._create()
+        await asyncio.gather(*(self.warm(identity) for identity in list(self.identities) if not identity.warmed))
+
+    # 后台预热任务
+    async def run(self):
+        while True:
+            try:
+                await self.fill()
+            except Exception:
+                logger.warning("设备身份池预热失败", exc_info=True)
+            await asyncio.sleep(self.settings["warm_interval"])
+
+    def snapshot(self):
+        return {
+            **self.counters,
+            "size": len(self.identities),
+            "warmed_identities": sum(1 for identity in self.identities if identity.warmed),
+        }
+
+identity_pool = None
+identity_pool_task = None
+
+# 获取设备身份池（首次使用时创建）
+def get_identity_pool():
+    global identity_pool
+    if identity_pool is None:
+        identity_pool = IdentityPool(get_settings("identity_pool"))
+    return identity_pool
+
 # 构建直接下载链接（基于视频ID）
 def build_direct_download_url(video_id):
     # 这是一种常见的抖音视频直链格式，但不一定总是有效
@@ -268,266 +1540,1193 @@ def build_direct_download_url(video_id):
     random_str = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=8))
     return f"https://aweme.snssdk.com/aweme/v1/play/?video_id={video_id}&ratio=720p&line=0&media_type=4&vr_type=0&improve_bitrate=0&is_play_url=1&is_support_h265=0&source=PackSourceEnum_PUBLISH&t={timestamp}{random_str}"
 
+# 常用的请求头UA
+IPHONE_UA = 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1'
+PC_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
+
+# 从HTML中提取视频地址用到的正则
+DOUYINVOD_PATTERN = re.compile(r'(https?://[^"\']+?douyinvod\.com/[^"\'\s]+)')
+PLAY_API_PATTERN = re.compile(r'"playApi":\s*"([^"]+)"')
+PLAY_API_VIDEO_ID_PATTERN = re.compile(r'video_id=([^&]+)')
+# 流式扫描页面时在分块之间保留的字符数，需要大于要匹配的链接长度
+SCAN_OVERLAP = 8192
+
+# 构建模拟浏览器的请求头
+def build_browser_headers(user_agent):
+    return {
+        'User-Agent': user_agent,
+        'Referer': 'https://www.douyin.com/',
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    }
+
+# 用固定格式构建的链接使用的解析方法名：这种链接不是从上游解析出来的，不一定能播放，不写入解析结果缓存
+FIXED_FORMAT_METHOD = "从固定格式构建"
+PLAY_API_FIXED_FORMAT_METHOD = "从playApi构建"
+FIXED_FORMAT_METHODS = {FIXED_FORMAT_METHOD, PLAY_API_FIXED_FORMAT_METHOD}
+
+# 用固定格式构建douyinvod链接
+def build_fixed_douyinvod_url(video_id):
+    timestamp = int(time.time())
+    return f"https://v26-web.douyinvod.com/video/tos/cn/tos-cn-ve-15c001-alinc2/{video_id}/?a=1128&ch=0&cr=0&dr=0&cd=0%7C0%7C0%7C0&cv=1&br=1064&bt=1064&cs=0&ds=3&ft=bvjPVvmzEm0WD12ql1T10.UBfa&mime_type=video_mp4&qs=0&rc=ZDU4OWk0OTM3aDg7NWc5OkBpM2c6OTw6ZnFyZzMzNGkzM0A0YjRgLWBjXjMxYC8vYTFeYSMuby5ecjRnMGJgLS1kLS9zcw%3D%3D&btag=e00028000&dy_q={timestamp}"
+
 # 获取真实视频地址（跟踪重定向）
-def get_real_video_url(url):
+async def get_real_video_url(url):
     try:
         if not url or not url.startswith("http"):
             return url
-            
-        # 设置请求头，模拟真实浏览器
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1',
-            'Referer': 'https://www.douyin.com/',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
         
-        # 发送请求并跟踪重定向
-        response = requests.get(url, headers=headers, timeout=15, allow_redirects=True)
+        # 逐跳跟踪重定向，到达douyinvod.com时停止，不下载视频内容
+        final_url, history, status_code = await resolve_upstream_redirects(url, build_browser_headers(IPHONE_UA))
         
         # 打印重定向历史，用于调试
-        print(f"重定向历史: {[h.url for h in response.history]}")
-        print(f"最终URL: {response.url}")
+        logger.debug("重定向历史: %s", history)
+        logger.debug("最终URL: %s", final_url)
         
-        # 返回最终URL
-        if response.status_code == 200:
-            final_url = response.url
-            # 确保返回的是douyinvod.com的链接
-            if "douyinvod.com" in final_url:
-                return final_url
-            # 如果不是douyinvod.com链接，尝试从响应头中获取
-            for history in response.history:
-                if "douyinvod.com" in history.url:
-                    return history.url
-            # 如果仍然找不到，返回原始URL
-            return url
+        # 确保返回的是douyinvod.com的链接，如果仍然找不到，返回原始URL
+        if is_douyinvod_url(final_url):
+            return final_url
         return url
     except Exception as e:
-        print(f"获取真实视频地址失败: {e}")
+        logger.debug("获取真实视频地址失败: %s", e)
         return url
 
+# 页面内嵌的状态数据：网页版的RENDER_DATA（URL编码的JSON）和分享页的window._ROUTER_DATA
+PAGE_STATE_START_PATTERN = re.compile(r'<script id="RENDER_DATA" type="application/json">|window\._ROUTER_DATA\s*=\s*')
+
+# 单次解析的上下文：在同一次解析的各个步骤之间共享（包括竞速模式下并发的策略任务）
+class ParseContext:
+    def __init__(self, deadline=None, request_id=None):
+        # 解析的截止时间（time.monotonic()），所有上游请求的超时都不会超过它
+        self.deadline = deadline
+        # 本次解析的ID，对应调试信息缓冲区中的记录，也写入解析过程中的每一条日志
+        self.request_id = request_id
+        # 从页面状态数据中提取的视频信息
+        self.page_info = None
+        # 本次解析中已经发起的上游请求，相同的请求复用第一次的结果；fetch_waiters记录每个请求还有几个调用方在等待
+        self.fetches = {}
+        self.fetch_waiters = {}
+        self.memo_hits = 0
+        # 批量解析时预先批量读取的缓存：{"short_link": {短链接: 视频ID或None}, "result": {视频ID: 解析结果或None}}，
+        # 其中的键不再单独查询缓存
+        self.prefetched = {"short_link": {}, "result": {}}
+
+    # 距离截止时间还剩多少秒，没有截止时间时返回None
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
+
+    # 取消已经没有调用方等待、但还没有完成的上游请求。还有等待者的请求不能取消：
+    # 发起者断开连接后，合并到同一个解析任务的其他请求仍然在等待它们
+    def cancel_fetches(self):
+        for key, task in self.fetches.items():
+            if not task.done() and not self.fetch_waiters.get(key):
+                task.cancel()
+
+# 判断上游请求是否相同时忽略的防缓存参数
+CACHE_BUSTER_PARAMS = {"t", "dy_q", "_"}
+
+# 规范化上游链接：去掉防缓存参数并对其余参数排序，作为请求去重的依据
+def normalize_upstream_url(url):
+    parts = urllib.parse.urlsplit(url)
+    query = sorted((name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if name not in CACHE_BUSTER_PARAMS)
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), ""))
+
+# 同一次解析中相同的上游请求只发起一次，之后的调用复用第一次的结果（包括异常）
+async def memoized_fetch(key, func):
+    parse_context = current_parse.get()
+    if parse_context is None:
+        return await func()
+    task = parse_context.fetches.get(key)
+    # 之前的请求因为所有调用方都被取消而取消了，重新发起
+    if task is None or task.cancelled():
+        task = asyncio.ensure_future(func())
+        # 竞速模式下取消某个策略时不能连带取消其他策略也在等待的请求
+        task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+        parse_context.fetches[key] = task
+    else:
+        parse_context.memo_hits += 1
+        metrics.inc("douyin_fetch_memo_hits_total", {"kind": key[0]})
+    parse_context.fetch_waiters[key] = parse_context.fetch_waiters.get(key, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # 最后一个等待的调用方（例如竞速中落后的策略）被取消时，请求的结果没有人需要了，一起取消
+        if parse_context.fetch_waiters[key] == 1:
+            task.cancel()
+        raise
+    finally:
+        parse_context.fetch_waiters[key] -= 1
+
+# 跟踪上游重定向（同一次解析中相同的链接只请求一次）
+async def resolve_upstream_redirects(url, headers):
+    return await memoized_fetch(
+        ("redirects", normalize_upstream_url(url)),
+        lambda: get_http_client().resolve_redirects(url, headers=headers),
+    )
+
+# 记录从页面中提取的视频信息，供最终结果使用
+def remember_page_info(page_info):
+    parse_context = current_parse.get()
+    if parse_context is not None and page_info and not parse_context.page_info:
+        parse_context.page_info = page_info
+
+# 解码页面状态数据，marker是匹配到的起始标记，content是标记之后到</script>之前的内容
+def decode_page_state(marker, content):
+    try:
+        if marker.startswith("<script"):
+            return json.loads(urllib.parse.unquote(content))
+        return json.loads(content.strip().rstrip(";"))
+    except ValueError:
+        return None
+
+# 在页面状态数据中查找视频条目（同时带有video和desc字段的对象）
+def find_page_item(node, depth=0):
+    if depth > 12:
+        return None
+    if isinstance(node, dict):
+        if isinstance(node.get("video"), dict) and "desc" in node:
+            return node
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        item = find_page_item(child, depth + 1)
+        if item is not None:
+            return item
+    return None
+
+# 把播放地址统一成链接列表：网页版是[{"src": ...}]，分享页是{"url_list": [...]}
+def collect_urls(addr):
+    if isinstance(addr, dict):
+        urls = addr.get("url_list") or []
+    elif isinstance(addr, list):
+        urls = [entry.get("src") if isinstance(entry, dict) else entry for entry in addr]
+    elif isinstance(addr, str):
+        urls = [addr]
+    else:
+        urls = []
+    return ["https:" + url if url.startswith("//") else url for url in urls if isinstance(url, str) and url]
+
+# 把视频条目整理成统一的视频信息：标题、封面、时长（秒）、播放地址和各个清晰度
+def normalize_page_item(item):
+    video = item.get("video") or {}
+    covers = collect_urls(video.get("cover") or video.get("originCover") or video.get("origin_cover"))
+    duration = video.get("duration") or item.get("duration")
+    bitrates = []
+    for variant in video.get("bit_rate") or video.get("bitRateList") or []:
+        bitrates.append({
+            "gear_name": variant.get("gear_name") or variant.get("gearName"),
+            "bit_rate": variant.get("bit_rate") or variant.get("bitRate"),
+            "width": variant.get("width") or (variant.get("play_addr") or {}).get("width"),
+            "height": variant.get("height") or (variant.get("play_addr") or {}).get("height"),
+            "play_urls": collect_urls(variant.get("play_addr") or variant.get("playAddr")),
+        })
+    return {
+        "title": item.get("desc") or None,
+        "cover_image": covers[0] if covers else None,
+        "duration": duration / 1000 if isinstance(duration, (int, float)) and duration > 1000 else duration,
+        "play_urls": collect_urls(video.get("play_addr") or video.get("playAddr")),
+        "bitrates": bitrates,
+    }
+
+# 从页面状态数据中提取视频信息
+def parse_page_state(marker, content):
+    state = decode_page_state(marker, content)
+    item = find_page_item(state) if state is not None else None
+    return normalize_page_item(item) if item is not None else None
+
+# 从完整的HTML中提取视频信息
+def extract_page_info(html):
+    match = PAGE_STATE_START_PATTERN.search(html)
+    if not match:
+        return None
+    end = html.find("</script>", match.end())
+    return parse_page_state(match.group(0), html[match.end():end if end != -1 else len(html)])
+
+# 从视频信息中选出douyinvod.com播放地址（按域名判断），优先使用默认播放地址，其次是各个清晰度的地址
+def pick_douyinvod_url(page_info):
+    if not page_info:
+        return None
+    candidates = page_info["play_urls"] + [url for variant in page_info["bitrates"] for url in variant["play_urls"]]
+    return next((url for url in candidates if is_douyinvod_url(url)), None)
+
+# 从start位置开始在缓冲区中查找还没找到的内容；匹配到缓冲区末尾时可能还没结束（跨越了分块边界），
+# 除非页面已经读完，否则等下一块数据到达后再确认
+def scan_page_buffer(buffer, patterns, found, finished, start=0):
+    for name, pattern in patterns.items():
+        if found[name]:
+            continue
+        match = pattern.search(buffer, start)
+        if match and (finished or match.end() < len(buffer)):
+            found[name] = match.group(1)
+
+# 扫描视频页面（同一次解析中同一类UA的页面只请求一次）
+async def scan_video_page(video_id, user_agent):
+    page_kind = "pc" if user_agent == PC_UA else "mobile"
+    return await memoized_fetch(("page", video_id, page_kind), lambda: fetch_and_scan_video_page(video_id, user_agent))
+
+# 流式扫描视频页面：边下载边解码，逐块查找douyinvod链接、playApi参数和页面状态数据，
+# 找到douyinvod链接或者解析出带播放地址的页面状态数据后立即关闭连接。
+# 返回{"douyinvod": 链接或None, "play_api": playApi参数或None, "page_info": 视频信息或None}
+async def fetch_and_scan_video_page(video_id, user_agent):
+    video_page_url = f"https://www.douyin.com/video/{video_id}"
+    patterns = {"douyinvod": DOUYINVOD_PATTERN, "play_api": PLAY_API_PATTERN}
+    found = {"douyinvod": None, "play_api": None, "page_info": None}
+    buffer = ""
+    # 缓冲区中已经扫描过的长度，新数据到达后只从它之前SCAN_OVERLAP个字符处开始查找，避免反复扫描整个缓冲区
+    scanned = 0
+    # 正在读取的页面状态数据的起始标记，读到</script>之前缓冲区不截断
+    state_marker = None
+    
+    async with get_http_client().stream("GET", video_page_url, headers=build_browser_headers(user_agent)) as response:
+        async for chunk in response.aiter_text():
+            buffer += chunk
+            scan_from = max(0, scanned - SCAN_OVERLAP)
+            scan_page_buffer(buffer, patterns, found, finished=False, start=scan_from)
+            
+            if state_marker is None and found["page_info"] is None:
+                state_match = PAGE_STATE_START_PATTERN.search(buffer, scan_from)
+                if state_match:
+                    state_marker = state_match.group(0)
+                    buffer = buffer[state_match.start():]
+                    scan_from = 0
+            if state_marker is not None:
+                state_end = buffer.find("</script>", max(len(state_marker), scan_from))
+                if state_end != -1:
+                    found["page_info"] = parse_page_state(state_marker, buffer[len(state_marker):state_end])
+                    state_marker = None
+                    remember_page_info(found["page_info"])
+            
+            # 链接在还没读完的页面状态数据中时继续读取，同一次请求还能得到标题、封面等信息
+            if (found["douyinvod"] and state_marker is None) or (found["page_info"] and pick_douyinvod_url(found["page_info"])):
+                return found
+            # 只保留末尾一段，用于匹配跨越分块边界的内容
+            if state_marker is None:
+                buffer = buffer[-SCAN_OVERLAP:]
+            scanned = len(buffer)
+    
+    scan_page_buffer(buffer, patterns, found, finished=True, start=max(0, scanned - SCAN_OVERLAP))
+    return found
+
+# 从页面的playApi参数获取视频地址
+async def resolve_play_api(play_api):
+    if not play_api:
+        return None, None
+    play_api = play_api.replace('\\u002F', '/').replace('\\/', '/')
+    
+    logger.debug("找到playApi: %s", play_api)
+    
+    # 手动构建douyinvod链接
+    if "video_id=" in play_api:
+        try:
+            # 提取参数
+            params_match = PLAY_API_VIDEO_ID_PATTERN.search(play_api)
+            if params_match:
+                douyinvod_url = build_fixed_douyinvod_url(params_match.group(1))
+                logger.debug("构建的douyinvod链接: %s", douyinvod_url)
+                return douyinvod_url, PLAY_API_FIXED_FORMAT_METHOD
+        except Exception as e:
+            logger.debug("构建douyinvod链接失败: %s", e)
+    
+    # 如果手动构建失败，尝试获取真实视频地址
+    real_url = await get_real_video_url(play_api)
+    if is_douyinvod_url(real_url):
+        logger.debug("从playApi中获取到douyinvod链接")
+        return real_url, "从playApi中提取"
+    return None, None
+
+# 请求特殊API链接，返回重定向到的douyinvod链接
+async def request_special_api(video_id):
+    special_url = build_direct_download_url(video_id)
+    special_headers = {
+        'User-Agent': IPHONE_UA,
+        'Referer': 'https://www.douyin.com/',
+    }
+    
+    final_url, history, status_code = await resolve_upstream_redirects(special_url, special_headers)
+    logger.debug("特殊API响应: 状态码=%s, URL=%s", status_code, final_url)
+    logger.debug("特殊API重定向历史: %s", history)
+    
+    return final_url if is_douyinvod_url(final_url) else None
+
 # 专门处理/video/格式链接
-def parse_video_format_url(video_id):
+async def parse_video_format_url(video_id):
     try:
-        print(f"开始处理视频ID: {video_id}")
-        
-        # 使用移动端UA
-        mobile_ua = get_mobile_ua()
-        
-        # 设置请求头
-        headers = {
-            'User-Agent': mobile_ua,
-            'Referer': 'https://www.douyin.com/',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        logger.debug("开始处理视频ID: %s", video_id)
         
         # 方法1: 直接访问视频页面，使用移动端UA
-        video_page_url = f"https://www.douyin.com/video/{video_id}"
-        print(f"尝试方法1: 访问 {video_page_url}")
-        response = requests.get(video_page_url, headers=headers, timeout=15)
-        html_content = response.text
+        logger.debug("尝试方法1: 访问 https://www.douyin.com/video/%s", video_id)
+        page = await scan_video_page(video_id, get_mobile_ua())
         
-        # 尝试从HTML中提取douyinvod.com链接
-        douyinvod_pattern = r'(https?://[^"\']+?douyinvod\.com/[^"\'\s]+)'
-        douyinvod_matches = re.findall(douyinvod_pattern, html_content)
+        # 优先使用页面状态数据中的播放地址
+        page_url = pick_douyinvod_url(page["page_info"])
+        if page_url:
+            logger.debug("方法1成功: 从页面数据中找到douyinvod链接")
+            return page_url, "从页面数据中提取"
         
-        if douyinvod_matches:
-            # 找到了douyinvod.com链接
-            print(f"方法1成功: 从HTML中找到douyinvod链接")
-            return douyinvod_matches[0], "从HTML中提取"
+        # 尝试从HTML中提取douyinvod.com链接
+        if page["douyinvod"]:
+            logger.debug("方法1成功: 从HTML中找到douyinvod链接")
+            return page["douyinvod"], "从HTML中提取"
         
         # 方法2: 使用PC端UA访问
-        pc_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-            'Referer': 'https://www.douyin.com/',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        logger.debug("尝试方法2: 使用PC端UA访问")
+        pc_page = await scan_video_page(video_id, PC_UA)
         
-        print(f"尝试方法2: 使用PC端UA访问")
-        pc_response = requests.get(video_page_url, headers=pc_headers, timeout=15)
-        pc_html_content = pc_response.text
-        
-        # 尝试从HTML中提取douyinvod.com链接
-        pc_douyinvod_matches = re.findall(douyinvod_pattern, pc_html_content)
+        pc_page_url = pick_douyinvod_url(pc_page["page_info"])
+        if pc_page_url:
+            logger.debug("方法2成功: 从PC端页面数据中找到douyinvod链接")
+            return pc_page_url, "从PC端页面数据中提取"
         
-        if pc_douyinvod_matches:
-            # 找到了douyinvod.com链接
-            print(f"方法2成功: 从PC端HTML中找到douyinvod链接")
-            return pc_douyinvod_matches[0], "从PC端HTML中提取"
+        if pc_page["douyinvod"]:
+            logger.debug("方法2成功: 从PC端HTML中找到douyinvod链接")
+            return pc_page["douyinvod"], "从PC端HTML中提取"
         
         # 方法3: 尝试从playApi参数获取
-        print(f"尝试方法3: 从playApi参数获取")
-        aweme_pattern = r'"playApi":\s*"([^"]+)"'
-        aweme_matches = re.search(aweme_pattern, html_content)
-        
-        if not aweme_matches:
-            aweme_matches = re.search(aweme_pattern, pc_html_content)
-        
-        if aweme_matches:
-            play_api = aweme_matches.group(1).replace('\\u002F', '/').replace('\\/', '/')
-            print(f"找到playApi: {play_api}")
-            
-            # 手动构建douyinvod链接
-            if "video_id=" in play_api:
-                try:
-                    # 提取参数
-                    params_match = re.search(r'video_id=([^&]+)', play_api)
-                    if params_match:
-                        vid = params_match.group(1)
-                        timestamp = int(time.time())
-                        # 构建一个可能的douyinvod链接
-                        douyinvod_url = f"https://v26-web.douyinvod.com/video/tos/cn/tos-cn-ve-15c001-alinc2/{vid}/?a=1128&ch=0&cr=0&dr=0&cd=0%7C0%7C0%7C0&cv=1&br=1064&bt=1064&cs=0&ds=3&ft=bvjPVvmzEm0WD12ql1T10.UBfa&mime_type=video_mp4&qs=0&rc=ZDU4OWk0OTM3aDg7NWc5OkBpM2c6OTw6ZnFyZzMzNGkzM0A0YjRgLWBjXjMxYC8vYTFeYSMuby5ecjRnMGJgLS1kLS9zcw%3D%3D&btag=e00028000&dy_q={timestamp}"
-                        print(f"构建的douyinvod链接: {douyinvod_url}")
-                        return douyinvod_url, "从playApi构建"
-                except Exception as e:
-                    print(f"构建douyinvod链接失败: {e}")
-            
-            # 如果手动构建失败，尝试获取真实视频地址
-            real_url = get_real_video_url(play_api)
-            if real_url and "douyinvod.com" in real_url:
-                print(f"方法3成功: 从playApi中获取到douyinvod链接")
-                return real_url, "从playApi中提取"
+        logger.debug("尝试方法3: 从playApi参数获取")
+        play_api_url, play_api_method = await resolve_play_api(page["play_api"] or pc_page["play_api"])
+        if play_api_url:
+            logger.debug("方法3成功: %s", play_api_method)
+            return play_api_url, play_api_method
         
         # 方法4: 使用特殊的API链接直接获取
-        print(f"尝试方法4: 使用特殊API链接")
-        # 生成随机字符串
-        timestamp = int(time.time())
-        random_str = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=8))
-        special_url = f"https://aweme.snssdk.com/aweme/v1/play/?video_id={video_id}&ratio=720p&line=0&media_type=4&vr_type=0&improve_bitrate=0&is_play_url=1&is_support_h265=0&source=PackSourceEnum_PUBLISH&t={timestamp}{random_str}"
-        
-        special_headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1',
-            'Referer': 'https://www.douyin.com/',
-        }
-        
+        logger.debug("尝试方法4: 使用特殊API链接")
         try:
-            special_response = requests.get(special_url, headers=special_headers, timeout=15, allow_redirects=True)
-            print(f"特殊API响应: 状态码={special_response.status_code}, URL={special_response.url}")
-            
-            if special_response.status_code == 200:
-                if "douyinvod.com" in special_response.url:
-                    print(f"方法4成功: 获取到douyinvod链接")
-                    return special_response.url, "从特殊链接中提取"
-                
-                # 检查响应历史
-                for history in special_response.history:
-                    if "douyinvod.com" in history.url:
-                        print(f"方法4成功: 从重定向历史中获取到douyinvod链接")
-                        return history.url, "从重定向历史中提取"
+            special_url = await request_special_api(video_id)
+            if special_url:
+                logger.debug("方法4成功: 获取到douyinvod链接")
+                return special_url, "从特殊链接中提取"
         except Exception as e:
-            print(f"特殊API请求失败: {e}")
+            logger.debug("特殊API请求失败: %s", e)
         
         # 方法5: 尝试直接从短链接获取真实地址
-        print(f"尝试方法5: 从短链接获取真实地址")
+        logger.debug("尝试方法5: 从短链接获取真实地址")
         direct_url = build_direct_download_url(video_id)
-        print(f"构建的短链接: {direct_url}")
+        logger.debug("构建的短链接: %s", direct_url)
         
         try:
-            real_direct_url = get_real_video_url(direct_url)
-            if real_direct_url and "douyinvod.com" in real_direct_url:
-                print(f"方法5成功: 从短链接获取到douyinvod链接")
+            real_direct_url = await get_real_video_url(direct_url)
+            if is_douyinvod_url(real_direct_url):
+                logger.debug("方法5成功: 从短链接获取到douyinvod链接")
                 return real_direct_url, "从直接链接中提取"
         except Exception as e:
-            print(f"从短链接获取真实地址失败: {e}")
+            logger.debug("从短链接获取真实地址失败: %s", e)
         
         # 如果所有方法都失败，尝试一个最后的方法
-        print(f"尝试最后方法: 使用固定格式构建douyinvod链接")
+        logger.debug("尝试最后方法: 使用固定格式构建douyinvod链接")
         try:
-            # 构建一个可能的douyinvod链接
-            timestamp = int(time.time())
-            douyinvod_url = f"https://v26-web.douyinvod.com/video/tos/cn/tos-cn-ve-15c001-alinc2/{video_id}/?a=1128&ch=0&cr=0&dr=0&cd=0%7C0%7C0%7C0&cv=1&br=1064&bt=1064&cs=0&ds=3&ft=bvjPVvmzEm0WD12ql1T10.UBfa&mime_type=video_mp4&qs=0&rc=ZDU4OWk0OTM3aDg7NWc5OkBpM2c6OTw6ZnFyZzMzNGkzM0A0YjRgLWBjXjMxYC8vYTFeYSMuby5ecjRnMGJgLS1kLS9zcw%3D%3D&btag=e00028000&dy_q={timestamp}"
-            return douyinvod_url, "从固定格式构建"
+            return build_fixed_douyinvod_url(video_id), FIXED_FORMAT_METHOD
         except Exception as e:
-            print(f"构建固定格式链接失败: {e}")
+            logger.debug("构建固定格式链接失败: %s", e)
         
         # 如果所有方法都失败，返回短链接作为后备
-        print(f"所有方法都失败，返回短链接作为后备")
+        logger.debug("所有方法都失败，返回短链接作为后备")
         return direct_url, "返回短链接(无法获取真实地址)"
     except Exception as e:
-        print(f"解析视频格式链接失败: {e}")
+        logger.warning("解析视频格式链接失败: %s", e)
         return None, f"解析失败: {str(e)}"
 
-# 尝试使用通用方法获取真实视频地址
-def get_universal_video_url(video_id):
-    try:
-        print(f"使用通用方法获取视频ID: {video_id} 的真实地址")
-        
-        # 使用移动端UA
-        mobile_ua = get_mobile_ua()
-        
-        # 构建视频短链接 - 使用通用的视频ID格式
-        timestamp = int(time.time())
-        random_str = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=8))
-        video_url = f"https://aweme.snssdk.com/aweme/v1/playwm/?video_id=v0200fg10000cvpmqdvog65o3idulk8g&ratio=720p&line=0&t={timestamp}{random_str}"
-        
-        # 设置请求头
-        headers = {
-            'User-Agent': mobile_ua,
-            'Referer': 'https://www.douyin.com/',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
+# 以下是竞速模式下可以同时启动的独立策略，每个策略返回(视频地址, 方法)，失败时视频地址为None
+async def strategy_special_api(video_id):
+    return await request_special_api(video_id), "从特殊链接中提取"
+
+async def strategy_mobile_html(video_id):
+    page = await scan_video_page(video_id, get_mobile_ua())
+    if pick_douyinvod_url(page["page_info"]):
+        return pick_douyinvod_url(page["page_info"]), "从页面数据中提取"
+    if page["douyinvod"]:
+        return page["douyinvod"], "从HTML中提取"
+    return await resolve_play_api(page["play_api"])
+
+async def strategy_pc_html(video_id):
+    pc_page = await scan_video_page(video_id, PC_UA)
+    if pick_douyinvod_url(pc_page["page_info"]):
+        return pick_douyinvod_url(pc_page["page_info"]), "从PC端页面数据中提取"
+    if pc_page["douyinvod"]:
+        return pc_page["douyinvod"], "从PC端HTML中提取"
+    return await resolve_play_api(pc_page["play_api"])
+
+async def strategy_direct_link(video_id):
+    real_direct_url = await get_real_video_url(build_direct_download_url(video_id))
+    if is_douyinvod_url(real_direct_url):
+        return real_direct_url, "从直接链接中提取"
+    return None, None
+
+RESOLVE_STRATEGIES = {
+    "special_api": strategy_special_api,
+    "mobile_html": strategy_mobile_html,
+    "pc_html": strategy_pc_html,
+    "direct_link": strategy_direct_link,
+}
+
+# 策略统计：按策略记录最近若干次尝试的成功率和耗时，用来自动调整策略顺序
+class StrategyStats:
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.methods = {}
+
+    def record(self, name, success, latency, method=None):
+        with self.lock:
+            self.attempts.setdefault(name, deque(maxlen=self.window)).append((success, latency))
+            if success and method:
+                method_counts = self.methods.setdefault(name, {})
+                method_counts[method] = method_counts.get(method, 0) + 1
+
+    def summary(self, name):
+        with self.lock:
+            attempts = list(self.attempts.get(name, ()))
+        if not attempts:
+            return {"samples": 0, "success_rate": None, "avg_latency": None}
+        successes = sum(1 for success, _ in attempts if success)
+        return {
+            "samples": len(attempts),
+            "success_rate": successes / len(attempts),
+            "avg_latency": sum(latency for _, latency in attempts) / len(attempts),
         }
-        
-        # 请求短链接，获取重定向后的真实URL
-        resp = requests.get(video_url, headers=headers, timeout=15, allow_redirects=True)
-        final_url = resp.url
-        redirect_history = [h.url for h in resp.history]
-        
-        print(f"重定向历史: {redirect_history}")
-        print(f"最终URL: {final_url}")
-        
-        # 如果获取到了douyinvod.com的链接，直接返回
-        if "douyinvod.com" in final_url:
-            return final_url, "通用方法-最终URL"
-        
-        # 如果重定向历史中有douyinvod.com的链接，返回第一个
-        for history_url in resp.history:
-            if "douyinvod.com" in history_url.url:
-                return history_url.url, "通用方法-重定向历史"
-        
-        # 如果上述方法都失败，尝试使用特殊API链接
-        special_url = f"https://aweme.snssdk.com/aweme/v1/play/?video_id={video_id}&ratio=720p&line=0&media_type=4&vr_type=0&improve_bitrate=0&is_play_url=1&is_support_h265=0&source=PackSourceEnum_PUBLISH&t={timestamp}{random_str}"
-        
-        special_headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1',
-            'Referer': 'https://www.douyin.com/',
+
+    # 按预期耗时（平均耗时 / 成功率）排序；样本不足的策略保持配置顺序排在最前面以便收集数据，
+    # 成功率过低的策略跳过（按explore_rate的概率偶尔再试一次，以便恢复）
+    def order(self, names, settings):
+        unknown, ranked, skipped = [], [], []
+        for name in names:
+            summary = self.summary(name)
+            if summary["samples"] < settings["min_samples"]:
+                unknown.append(name)
+            elif summary["success_rate"] < settings["min_success_rate"] and random.random() >= settings["explore_rate"]:
+                skipped.append(name)
+            else:
+                expected_cost = summary["avg_latency"] / max(summary["success_rate"], 0.01)
+                ranked.append((expected_cost, name))
+        ordered = unknown + [name for _, name in sorted(ranked)]
+        # 所有策略都被跳过时仍然全部尝试
+        return ordered or skipped
+
+    def snapshot(self):
+        with self.lock:
+            names = list(self.attempts)
+            methods = {name: dict(counts) for name, counts in self.methods.items()}
+        return {name: {**self.summary(name), "methods": methods.get(name, {})} for name in names}
+
+strategy_stats = None
+
+# 获取策略统计（首次使用时创建）
+def get_strategy_stats():
+    global strategy_stats
+    if strategy_stats is None:
+        strategy_stats = StrategyStats(get_settings("resolver")["stats_window"])
+    return strategy_stats
+
+@app.get("/metrics")
+def metrics_endpoint(authorized: bool = Depends(verify_access)):
+    """
+    Prometheus格式的监控指标：请求数和耗时、解析方法耗时、上游请求、连接池、缓存和进行中的请求数。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    # 多进程模式下计数器和直方图是所有进程的合计，其余的当前值只来自处理这次请求的进程
+    registry = metrics
+    if shared_state is not None:
+        registry = MetricsRegistry()
+        registry.descriptions = metrics.descriptions
+        registry.merge(metrics.export())
+        max_age = get_settings("multi_worker")["poll_interval"] * 10
+        for worker_id, exported in shared_state.worker_metrics(max_age).items():
+            if worker_id != WORKER_ID:
+                registry.merge(exported)
+    
+    current_values = [("douyin_http_requests_in_flight", {}, http_requests_in_flight)]
+    for host, host_stats in get_http_client().stats.snapshot().items():
+        current_values.append(("douyin_pool_requests_total", {"host": host, "outcome": "hit"}, host_stats["pool_hits"]))
+        current_values.append(("douyin_pool_requests_total", {"host": host, "outcome": "miss"}, host_stats["pool_misses"]))
+    
+    result_cache_stats = get_result_cache().snapshot()
+    short_link_stats = get_short_link_cache().snapshot()
+    for event in ("hits", "misses", "evictions", "expirations"):
+        current_values.append(("douyin_cache_events_total", {"cache": "result", "event": event}, result_cache_stats[event]))
+    for event in ("hits", "misses"):
+        current_values.append(("douyin_cache_events_total", {"cache": "short_link", "event": event}, short_link_stats[event]))
+    current_values.append(("douyin_cache_entries", {"cache": "result"}, result_cache_stats["entries"]))
+    current_values.append(("douyin_cache_entries", {"cache": "short_link"}, short_link_stats["entries"]))
+    current_values.append(("douyin_result_cache_bytes", {}, result_cache_stats["bytes"]))
+    for cache, stats in (("result", result_cache_stats), ("short_link", short_link_stats)):
+        if "remote" in stats:
+            current_values.append(("douyin_cache_backend_up", {"cache": cache}, 1 if stats["remote"]["state"] == "up" else 0))
+            current_values.append(("douyin_cache_backend_errors_total", {"cache": cache}, stats["remote"]["remote_errors"]))
+    current_values.append(("douyin_single_flight_in_flight", {}, single_flight.snapshot()["in_flight"]))
+    if job_store is not None:
+        for state, count in job_store.state_counts().items():
+            current_values.append(("douyin_job_items", {"state": state}, count))
+    for name, summary in get_strategy_stats().snapshot().items():
+        if summary["success_rate"] is not None:
+            current_values.append(("douyin_strategy_success_rate", {"strategy": name}, summary["success_rate"]))
+    for kind, kind_breakers in get_circuit_breakers().snapshot().items():
+        for name, summary in kind_breakers.items():
+            state_value = {"closed": 0, "half_open": 0.5, "open": 1}[summary["state"]]
+            current_values.append(("douyin_circuit_breaker_open", {"kind": kind, "name": name}, state_value))
+    
+    return PlainTextResponse(registry.render(current_values), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/strategies")
+def strategies_stats(authorized: bool = Depends(verify_access)):
+    """
+    解析策略统计：每个策略最近若干次尝试的成功率、平均耗时，以及当前的自适应执行顺序。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    settings = get_settings("resolver")
+    stats = get_strategy_stats()
+    return {
+        "strategies": stats.snapshot(),
+        "configured_order": settings["strategies"],
+        "adaptive_order": stats.order(settings["strategies"], {**settings, "explore_rate": 0}) if settings["adaptive"] else None
+    }
+
+@app.get("/admin/breakers")
+def breakers_stats(is_admin: bool = Depends(verify_admin)):
+    """
+    熔断器状态：每个上游域名和解析策略当前的熔断状态（closed/open/half_open）、最近的错误率和慢调用比例。
+    """
+    if not is_admin:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    return {
+        "settings": get_settings("circuit_breaker"),
+        "breakers": get_circuit_breakers().snapshot()
+    }
+
+# 竞速/对冲模式：同时（或按对冲延迟错开）启动多个策略，返回第一个有效的douyinvod.com链接并取消其余策略；
+# 顺序模式下一次只运行一个策略
+async def race_video_url(video_id, settings):
+    hedge_delay = settings["hedge_delay"] if settings["mode"] == "hedge" else 0
+    max_fanout = 1 if settings["mode"] == "sequential" else max(1, int(settings["max_fanout"]))
+    stats = get_strategy_stats()
+    names = [name for name in settings["strategies"] if name in RESOLVE_STRATEGIES]
+    if settings["adaptive"]:
+        names = stats.order(names, settings)
+    pending = [(name, RESOLVE_STRATEGIES[name]) for name in names]
+    running = {}
+    errors = []
+    breakers = get_circuit_breakers()
+    
+    try:
+        while pending or running:
+            # 竞速模式一次性把并发名额占满，对冲模式每轮只追加一个策略
+            while pending and len(running) < max_fanout:
+                name, strategy = pending.pop(0)
+                # 已熔断的策略直接跳过
+                breaker = breakers.get("strategy", name)
+                if breaker is not None and not breaker.allow():
+                    metrics.inc("douyin_circuit_breaker_rejections_total", {"kind": "strategy", "name": name})
+                    errors.append(f"{name}: 已熔断")
+                    continue
+                logger.debug("启动策略: %s", name)
+                running[asyncio.create_task(strategy(video_id))] = (name, time.monotonic(), breaker)
+                if hedge_delay:
+                    break
+            if not running:
+                break
+            
+            # 对冲模式下还有等待启动的策略时，最多等待对冲延迟就启动下一个
+            timeout = hedge_delay if hedge_delay and pending and len(running) < max_fanout else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done:
+                name, started_at, breaker = running.pop(task)
+                latency = time.monotonic() - started_at
+                try:
+                    video_url, method = task.result()
+                except Exception as e:
+                    logger.debug("策略%s失败: %s", name, e)
+                    if breaker is not None:
+                        breaker.record(False, latency)
+                    stats.record(name, False, latency)
+                    metrics.observe("douyin_strategy_duration_seconds", {"strategy": name, "outcome": "error"}, latency)
+                    errors.append(f"{name}: {e}")
+                    continue
+                if breaker is not None:
+                    breaker.record(is_douyinvod_url(video_url), latency)
+                if is_douyinvod_url(video_url):
+                    logger.debug("策略%s最先成功: %s", name, method)
+                    stats.record(name, True, latency, method)
+                    metrics.observe("douyin_strategy_duration_seconds", {"strategy": name, "outcome": "success"}, latency)
+                    return video_url, method
+                stats.record(name, False, latency)
+                metrics.observe("douyin_strategy_duration_seconds", {"strategy": name, "outcome": "failure"}, latency)
+                errors.append(f"{name}: 未找到douyinvod链接")
+    finally:
+        # 取消仍在进行中的策略（被取消的策略不计入统计）
+        for task, (_, _, breaker) in running.items():
+            task.cancel()
+            if breaker is not None:
+                breaker.release()
+    
+    # 所有策略都失败时，和顺序模式一样使用固定格式构建
+    logger.warning("所有策略都失败: %s", errors)
+    return build_fixed_douyinvod_url(video_id), FIXED_FORMAT_METHOD
+
+# 缓存后端出错（Redis返回错误或者响应格式不对）
+class CacheBackendError(Exception):
+    pass
+
+# 访问远程缓存后端时可能出现的错误：网络错误、连接被关闭、超时和后端返回的错误
+CACHE_BACKEND_ERRORS = (OSError, EOFError, asyncio.TimeoutError, CacheBackendError)
+
+# 内存缓存后端：每个条目有自己的过期时间，超出内存上限时按LRU淘汰。
+# 所有缓存后端的接口相同：get_many(keys)返回{key: (value, 剩余秒数或None)}，set_many([(key, value, 缓存秒数或None)])
+class MemoryCacheBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.counters = {"evictions": 0, "expirations": 0}
+
+    async def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, _, value = entry
+                if expires_at is not None and expires_at <= now:
+                    self._remove(key)
+                    self.counters["expirations"] += 1
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = (value, expires_at - now if expires_at is not None else None)
+        return found
+
+    async def set_many(self, items):
+        now = time.time()
+        with self.lock:
+            for key, value, ttl in items:
+                size = len(value.encode("utf-8"))
+                if size > self.max_bytes:
+                    continue
+                if key in self.entries:
+                    self._remove(key)
+                self.entries[key] = (now + ttl if ttl is not None else None, size, value)
+                self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def snapshot(self):
+        with self.lock:
+            return {**self.counters, "entries": len(self.entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+    async def close(self):
+        pass
+
+# 多进程模式下的缓存后端：条目保存在共享状态的SQLite数据库中，所有进程共用，超出上限时按最近访问时间淘汰；
+# 数据库读写在线程中执行，不阻塞事件循环
+class SharedStateCacheBackend:
+    # 没有过期时间的条目使用的过期时间戳（9999年）
+    NEVER_EXPIRES = 253402300799
+
+    def __init__(self, state, max_bytes):
+        self.state = state
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counters = {"evictions": 0, "expirations": 0}
+
+    async def get_many(self, keys):
+        now = time.time()
+        rows, expired = await asyncio.to_thread(self.state.cache_get_many, keys, now)
+        if expired:
+            with self.lock:
+                self.counters["expirations"] += expired
+        return {
+            key: (value, expires_at - now if expires_at < self.NEVER_EXPIRES else None)
+            for key, (expires_at, value) in rows.items()
         }
-        
-        special_resp = requests.get(special_url, headers=special_headers, timeout=15, allow_redirects=True)
-        special_final_url = special_resp.url
-        special_redirect_history = [h.url for h in special_resp.history]
-        
-        print(f"特殊API重定向历史: {special_redirect_history}")
-        print(f"特殊API最终URL: {special_final_url}")
-        
-        # 如果获取到了douyinvod.com的链接，直接返回
-        if "douyinvod.com" in special_final_url:
-            return special_final_url, "特殊API-最终URL"
-        
-        # 如果重定向历史中有douyinvod.com的链接，返回第一个
-        for history_url in special_resp.history:
-            if "douyinvod.com" in history_url.url:
-                return history_url.url, "特殊API-重定向历史"
-        
-        # 如果所有方法都失败，返回None
-        return None, "所有方法都失败"
+
+    async def set_many(self, items):
+        now = time.time()
+        rows = []
+        for key, value, ttl in items:
+            size = len(value.encode("utf-8"))
+            if size <= self.max_bytes:
+                rows.append((key, now + ttl if ttl is not None else self.NEVER_EXPIRES, size, value))
+        if not rows:
+            return
+        evicted = await asyncio.to_thread(self.state.cache_set_many, rows, self.max_bytes, now)
+        with self.lock:
+            self.counters["evictions"] += evicted
+
+    def snapshot(self):
+        entries, total_bytes = self.state.cache_summary()
+        with self.lock:
+            return {**self.counters, "entries": entries, "bytes": total_bytes, "max_bytes": self.max_bytes}
+
+    async def close(self):
+        pass
+
+# 一个Redis连接：按RESP协议发送命令，一次发送多条命令（流水线）再依次读取回复
+class RedisConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    def encode(command):
+        parts = [f"*{len(command)}\r\n".encode()]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    # 读取一条回复；回复格式不对（例如长度不是数字、内容不是UTF-8）时抛出CacheBackendError
+    async def read_reply(self):
+        try:
+            return await self._read_reply()
+        except (ValueError, asyncio.LimitOverrunError) as e:
+            raise CacheBackendError(f"无法解析的回复: {e}") from e
+
+    async def _read_reply(self):
+        line = await self.reader.readuntil(b"\r\n")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode("utf-8")
+        if prefix == b"-":
+            return CacheBackendError(body.decode("utf-8", "replace"))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(body)
+            return None if length < 0 else [await self._read_reply() for _ in range(length)]
+        raise CacheBackendError(f"无法识别的回复: {line[:50]!r}")
+
+    # 执行多条命令，返回每条命令的回复；命令出错时回复是CacheBackendError对象
+    async def execute_many(self, commands):
+        self.writer.write(b"".join(self.encode(command) for command in commands))
+        await self.writer.drain()
+        return [await self.read_reply() for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+# Redis客户端：限制同时使用的连接数，保留少量空闲连接复用，每次操作（包括等待连接）都有超时；
+# 出错的连接直接关闭，不放回连接池
+class RedisClient:
+    def __init__(self, settings):
+        self.settings = settings
+        url = urllib.parse.urlsplit(settings["url"])
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 6379
+        self.password = urllib.parse.unquote(url.password) if url.password else None
+        self.db = int(url.path.strip("/") or 0)
+        self.idle = []
+        self.connections = asyncio.Semaphore(settings["max_connections"])
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = RedisConnection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(["AUTH", self.password])
+        if self.db:
+            setup.append(["SELECT", self.db])
+        if setup:
+            for reply in await connection.execute_many(setup):
+                if isinstance(reply, CacheBackendError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def execute_many(self, commands):
+        await asyncio.wait_for(self.connections.acquire(), timeout=self.settings["timeout"])
+        try:
+            return await self._execute_many(commands)
+        finally:
+            self.connections.release()
+
+    async def _execute_many(self, commands):
+        connection = self.idle.pop() if self.idle else None
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(self._connect(), timeout=self.settings["timeout"])
+            replies = await asyncio.wait_for(connection.execute_many(commands), timeout=self.settings["timeout"])
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            raise
+        if len(self.idle) < self.settings["pool_size"]:
+            self.idle.append(connection)
+        else:
+            connection.close()
+        return replies
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+# Redis缓存后端：键名加上前缀，条目的缓存时间用PX（毫秒）设置，批量读写都在一次往返中完成
+class RedisCacheBackend:
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    async def get_many(self, keys):
+        commands = []
+        for key in keys:
+            commands.append(["GET", self.prefix + key])
+            commands.append(["PTTL", self.prefix + key])
+        replies = await self.client.execute_many(commands)
+        found = {}
+        for i, key in enumerate(keys):
+            value, pttl = replies[2 * i], replies[2 * i + 1]
+            if isinstance(value, CacheBackendError):
+                raise value
+            if value is not None:
+                found[key] = (value, pttl / 1000 if isinstance(pttl, int) and pttl > 0 else None)
+        return found
+
+    async def set_many(self, items):
+        commands = []
+        for key, value, ttl in items:
+            if ttl is not None:
+                commands.append(["SET", self.prefix + key, value, "PX", max(1, int(ttl * 1000))])
+            else:
+                commands.append(["SET", self.prefix + key, value])
+        for reply in await self.client.execute_many(commands):
+            if isinstance(reply, CacheBackendError):
+                raise reply
+
+    def snapshot(self):
+        return {"url": f"redis://{self.client.host}:{self.client.port}/{self.client.db}", "prefix": self.prefix}
+
+    async def close(self):
+        await self.client.close()
+
+# 两级缓存：先查本地后端，没有时再查远程后端并写回本地；写入时两级都写。
+# 远程后端出错时在retry_interval秒内只使用本地缓存，之后再重新尝试
+class TieredCacheBackend:
+    def __init__(self, local, remote, retry_interval):
+        self.local = local
+        self.remote = remote
+        self.retry_interval = retry_interval
+        self.down_until = 0
+        self.last_error = None
+        self.counters = {"remote_hits": 0, "remote_errors": 0}
+
+    def remote_available(self):
+        return time.monotonic() >= self.down_until
+
+    def _mark_down(self, error):
+        self.down_until = time.monotonic() + self.retry_interval
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.counters["remote_errors"] += 1
+        logger.warning("缓存后端不可用，%s秒内只使用本地缓存: %s", self.retry_interval, self.last_error)
+
+    async def get_many(self, keys):
+        found = await self.local.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing and self.remote_available():
+            try:
+                remote_found = await self.remote.get_many(missing)
+            except CACHE_BACKEND_ERRORS as e:
+                self._mark_down(e)
+            else:
+                if remote_found:
+                    self.counters["remote_hits"] += len(remote_found)
+                    await self.local.set_many([(key, value, ttl) for key, (value, ttl) in remote_found.items()])
+                    found.update(remote_found)
+        return found
+
+    async def set_many(self, items):
+        await self.local.set_many(items)
+        if self.remote_available():
+            try:
+                await self.remote.set_many(items)
+            except CACHE_BACKEND_ERRORS as e:
+                self._mark_down(e)
+
+    def snapshot(self):
+        return {
+            **self.local.snapshot(),
+            "remote": {
+                **self.remote.snapshot(),
+                **self.counters,
+                "state": "up" if self.remote_available() else "down",
+                "last_error": self.last_error,
+            },
+        }
+
+    async def close(self):
+        await self.remote.close()
+        await self.local.close()
+
+redis_client = None
+
+# 按配置给本地缓存后端加上远程缓存后端，namespace用于区分不同缓存的键名
+def build_cache_backend(local, namespace):
+    global redis_client
+    settings = get_settings("cache_backend")
+    if settings["type"] != "redis":
+        return local
+    if redis_client is None:
+        redis_client = RedisClient(settings)
+    return TieredCacheBackend(local, RedisCacheBackend(redis_client, f"{settings['key_prefix']}{namespace}:"), settings["retry_interval"])
+
+# 解析结果缓存：按video_id缓存成功的解析结果，过期时间取自douyinvod链接中的过期参数
+class ResultCache:
+    def __init__(self, settings, backend):
+        self.settings = settings
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    # 根据视频地址中的过期参数（x-expires等，Unix时间戳）计算缓存时间
+    def ttl_for(self, video_url):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(video_url).query)
+        for name in ("x-expires", "expires", "expire"):
+            if name in query and query[name][0].isdigit():
+                ttl = int(query[name][0]) - time.time() - self.settings["expiry_margin"]
+                return min(ttl, self.settings["max_ttl"])
+        return self.settings["default_ttl"]
+
+    # 批量读取，返回{video_id: 解析结果}，只包含命中的视频
+    async def get_many(self, video_ids):
+        found = await self.backend.get_many(video_ids)
+        with self.lock:
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(video_ids) - len(found)
+        return {video_id: orjson.loads(value) for video_id, (value, _) in found.items()}
+
+    async def get(self, video_id):
+        return (await self.get_many([video_id])).get(video_id)
+
+    # 批量写入{video_id: 解析结果}，已经过期的链接不缓存
+    async def set_many(self, results):
+        items = []
+        for video_id, data in results.items():
+            ttl = self.ttl_for(data["video_url"])
+            if ttl > 0:
+                items.append((video_id, orjson.dumps(data).decode("utf-8"), ttl))
+        if items:
+            await self.backend.set_many(items)
+
+    async def set(self, video_id, data):
+        await self.set_many({video_id: data})
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {**counters, **self.backend.snapshot()}
+
+    async def close(self):
+        await self.backend.close()
+
+result_cache = None
+
+# 获取解析结果缓存（首次使用时创建）
+def get_result_cache():
+    global result_cache
+    if result_cache is None:
+        settings = get_settings("result_cache")
+        if shared_state is not None:
+            local = SharedStateCacheBackend(shared_state, settings["max_bytes"])
+        else:
+            local = MemoryCacheBackend(settings["max_bytes"])
+        result_cache = ResultCache(settings, build_cache_backend(local, "result"))
+    return result_cache
+
+# 短链接映射的本地后端：把短链接解析出的视频ID永久保存到SQLite（短链接对应的视频不会变，不使用缓存时间）
+class ShortLinkStore:
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS short_links ("
+            "short_link TEXT PRIMARY KEY, video_id TEXT NOT NULL, created_at INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+
+    # 数据库读写在线程中执行，不阻塞事件循环
+    async def get_many(self, short_links):
+        return await asyncio.to_thread(self._get_many, short_links)
+
+    async def set_many(self, items):
+        await asyncio.to_thread(self._set_many, items)
+
+    def _get_many(self, short_links):
+        found = {}
+        with self.lock:
+            for short_link in short_links:
+                row = self.conn.execute("SELECT video_id FROM short_links WHERE short_link = ?", (short_link,)).fetchone()
+                if row:
+                    found[short_link] = (row[0], None)
+        return found
+
+    def _set_many(self, items):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO short_links (short_link, video_id, created_at) VALUES (?, ?, ?)",
+                [(short_link, video_id, int(time.time())) for short_link, video_id, _ in items],
+            )
+            self.conn.commit()
+
+    def snapshot(self):
+        with self.lock:
+            return {"entries": self.conn.execute("SELECT COUNT(*) FROM short_links").fetchone()[0]}
+
+    async def close(self):
+        with self.lock:
+            self.conn.close()
+
+# 短链接映射：同一个短链接不再重复请求；使用远程缓存后端时条目的缓存时间为ttl秒
+class ShortLinkCache:
+    def __init__(self, settings, backend):
+        self.settings = settings
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    # 批量读取，返回{短链接: 视频ID}，只包含命中的短链接
+    async def get_many(self, short_links):
+        found = await self.backend.get_many(short_links)
+        with self.lock:
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(short_links) - len(found)
+        return {short_link: video_id for short_link, (video_id, _) in found.items()}
+
+    async def get(self, short_link):
+        return (await self.get_many([short_link])).get(short_link)
+
+    async def set(self, short_link, video_id):
+        await self.backend.set_many([(short_link, video_id, self.settings["ttl"])])
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {**counters, **self.backend.snapshot()}
+
+    async def close(self):
+        await self.backend.close()
+
+short_link_cache = None
+
+# 获取短链接映射（首次使用时打开数据库）
+def get_short_link_cache():
+    global short_link_cache
+    if short_link_cache is None:
+        settings = get_settings("short_link_cache")
+        try:
+            local = ShortLinkStore(settings["path"])
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("无法打开短链接映射数据库，改为只保存在内存中: %s", e)
+            local = MemoryCacheBackend(settings["max_bytes"])
+        short_link_cache = ShortLinkCache(settings, build_cache_backend(local, "short_link"))
+    return short_link_cache
+
+# 规范化短链接：统一协议和域名大小写，去掉查询参数、锚点和末尾的斜杠
+def normalize_short_link(url):
+    parts = urllib.parse.urlsplit(url.strip())
+    return f"https://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+# 合并并发的相同请求：同一个key同时只有一个解析在进行，其他调用方等待同一个结果（包括异常）
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+        self.counters = {"leaders": 0, "joined": 0}
+
+    async def do(self, key, func):
+        task = self.calls.get(key)
+        if task is None:
+            self.counters["leaders"] += 1
+            # 解析在独立的任务中进行，发起者断开连接也不会影响其他等待者
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        else:
+            self.counters["joined"] += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # 所有等待者都已断开时，避免出现未读取异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    def snapshot(self):
+        return {**self.counters, "in_flight": len(self.calls)}
+
+single_flight = SingleFlight()
+
+@app.get("/stats/cache")
+def cache_stats(authorized: bool = Depends(verify_access)):
+    """
+    缓存统计：解析结果缓存的命中、未命中、淘汰和过期次数，以及短链接映射的命中情况。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    return {
+        "result_cache": get_result_cache().snapshot(),
+        "short_link_cache": get_short_link_cache().snapshot(),
+        "single_flight": single_flight.snapshot()
+    }
+
+# 根据视频ID获取真实视频地址，依次尝试竞速模式、特殊API链接和/video/格式解析
+async def resolve_video_id(video_id, debug_info):
+    # 竞速/对冲模式同时尝试多个独立策略，取最先成功的结果；开启自适应时顺序模式也按统计结果排序逐个尝试
+    resolver_settings = get_settings("resolver")
+    if resolver_settings["mode"] in ("race", "hedge") or resolver_settings["adaptive"]:
+        try:
+            video_url, method = await race_video_url(video_id, resolver_settings)
+            if video_url:
+                return video_url, method
+        except Exception as e:
+            debug_info["race_error"] = str(e)
+    
+    # 尝试使用特殊API链接获取真实视频地址
+    try:
+        special_url = await request_special_api(video_id)
+        if special_url:
+            return special_url, "特殊API-最终URL"
     except Exception as e:
-        print(f"通用方法获取视频地址失败: {e}")
-        return None, f"获取失败: {str(e)}"
+        debug_info["special_api_error"] = str(e)
+    
+    # 尝试使用/video/格式解析获取真实视频地址
+    try:
+        video_url, method = await parse_video_format_url(video_id)
+        if video_url:
+            return video_url, method
+    except Exception as e:
+        debug_info["parse_video_format_url_error"] = str(e)
+    
+    return None, None
 
 @app.get("/parse-douyin")
-def parse_douyin_link(
+async def parse_douyin_link(
     url: str = Query(..., description="抖音短视频链接"),
+    deadline: Optional[float] = Query(None, description="解析时间预算（秒）"),
+    verbosity: Optional[str] = Query(None, description="返回内容：lean、default 或 debug"),
+    x_deadline: Optional[float] = Header(None, alias="X-Deadline"),
     authorized: bool = Depends(verify_access)
 ):
     """
@@ -535,97 +2734,727 @@ def parse_douyin_link(
     """
     if not authorized:
         raise HTTPException(status_code=401, detail="Unauthorized")
-        
+    verbosity = check_verbosity(verbosity)
+    
+    return ORJSONResponse(content=shape_result(await parse_link(url, deadline or x_deadline, current_request_id.get()), verbosity))
+
+@app.get("/debug/{request_id}")
+def debug_details(request_id: str, authorized: bool = Depends(verify_access)):
+    """
+    按request_id查询最近一次解析的完整调试信息。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    entry = get_debug_buffer().get(request_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="没有找到该请求的调试信息，可能已被新的记录覆盖")
+    return ORJSONResponse(content=entry)
+
+# 批量解析请求
+class BatchParseRequest(BaseModel):
+    urls: List[str]
+
+batch_semaphore = None
+
+# 批量解析的全局并发限制（首次使用时创建）
+def get_batch_semaphore():
+    global batch_semaphore
+    if batch_semaphore is None:
+        batch_semaphore = asyncio.Semaphore(get_settings("batch")["concurrency"])
+    return batch_semaphore
+
+# 检查批量解析的链接数量
+def check_batch_size(urls):
+    max_links = get_settings("batch")["max_links"]
+    if len(urls) > max_links:
+        raise HTTPException(status_code=400, detail=f"一次最多解析{max_links}个链接")
+
+# 批量内去重：能直接提取视频ID的按视频ID合并，其余按规范化后的链接合并，返回{key: [输入位置]}
+def group_batch_urls(urls):
+    groups = {}
+    for index, url in enumerate(urls):
+        key = extract_video_id(url) or normalize_short_link(url if url.startswith('http') else 'https://' + url)
+        groups.setdefault(key, []).append(index)
+    return groups
+
+# 批量读取一批链接的短链接映射和解析结果缓存，每个缓存只访问一次，返回ParseContext.prefetched格式的字典
+async def prefetch_batch_caches(urls, groups):
+    prefetched = {"short_link": {}, "result": {}}
+    video_ids = [key for key in groups if extract_video_id(urls[groups[key][0]])]
+    short_links = [key for key in groups if key not in video_ids]
+    if short_links and get_settings("short_link_cache")["enabled"]:
+        found = await get_short_link_cache().get_many(short_links)
+        prefetched["short_link"] = {short_link: found.get(short_link) for short_link in short_links}
+        video_ids += [video_id for video_id in found.values() if video_id not in video_ids]
+    if video_ids and get_settings("result_cache")["enabled"]:
+        found = await get_result_cache().get_many(video_ids)
+        prefetched["result"] = {video_id: found.get(video_id) for video_id in video_ids}
+    return prefetched
+
+# 批量解析：每组链接只解析一次，在全局并发限制下解析，按完成顺序逐个产出每个输入链接的结果；
+# deadline是每个链接的解析时间预算
+async def iter_batch_results(urls, groups, deadline=None):
+    prefetched = await prefetch_batch_caches(urls, groups)
+    
+    async def parse_group(key):
+        async with get_batch_semaphore():
+            try:
+                return key, await parse_link(urls[groups[key][0]], deadline, prefetched=prefetched)
+            except Exception as e:
+                return key, {"status": "error", "message": "解析失败", "debug_info": str(e)}
+    
+    tasks = [asyncio.ensure_future(parse_group(key)) for key in groups]
     try:
-        # 第一步：处理输入的URL，确保格式正确
-        if not url.startswith('http'):
-            url = 'https://' + url
-        
-        # 记录调试信息
-        debug_info = {
-            "original_url": url,
+        for next_done in asyncio.as_completed(tasks):
+            key, result = await next_done
+            for index in groups[key]:
+                yield {"index": index, "url": urls[index], **result}
+    finally:
+        # 客户端提前断开时取消还没完成的解析
+        for task in tasks:
+            task.cancel()
+
+@app.post("/parse-douyin/batch")
+async def parse_douyin_batch(
+    batch: BatchParseRequest,
+    deadline: Optional[float] = Query(None, description="每个链接的解析时间预算（秒）"),
+    verbosity: Optional[str] = Query(None, description="返回内容：lean、default 或 debug"),
+    x_deadline: Optional[float] = Header(None, alias="X-Deadline"),
+    authorized: bool = Depends(verify_access)
+):
+    """
+    批量解析抖音链接，按输入顺序返回每个链接的解析结果或错误信息。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    verbosity = check_verbosity(verbosity)
+    
+    check_batch_size(batch.urls)
+    
+    groups = group_batch_urls(batch.urls)
+    results = [None] * len(batch.urls)
+    async for item in iter_batch_results(batch.urls, groups, deadline or x_deadline):
+        results[item["index"]] = shape_result(item, verbosity)
+    
+    return ORJSONResponse(content={
+        "status": "success",
+        "total": len(results),
+        "unique": len(groups),
+        "results": results
+    })
+
+@app.post("/parse-douyin/stream")
+async def parse_douyin_stream(
+    batch: BatchParseRequest,
+    format: str = Query("ndjson", description="输出格式：ndjson 或 sse"),
+    deadline: Optional[float] = Query(None, description="每个链接的解析时间预算（秒）"),
+    verbosity: Optional[str] = Query(None, description="返回内容：lean、default 或 debug"),
+    x_deadline: Optional[float] = Header(None, alias="X-Deadline"),
+    authorized: bool = Depends(verify_access)
+):
+    """
+    流式批量解析：每个链接解析完成后立即输出一行NDJSON（或一个SSE事件），结果中的index对应输入顺序。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format只支持ndjson或sse")
+    verbosity = check_verbosity(verbosity)
+    
+    check_batch_size(batch.urls)
+    
+    groups = group_batch_urls(batch.urls)
+    
+    async def generate():
+        async for item in iter_batch_results(batch.urls, groups, deadline or x_deadline):
+            line = orjson.dumps(shape_result(item, verbosity)).decode("utf-8")
+            yield f"event: result\ndata: {line}\n\n" if format == "sse" else line + "\n"
+        if format == "sse":
+            yield f"event: done\ndata: {json.dumps({'total': len(batch.urls), 'unique': len(groups)})}\n\n"
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+# 异步任务存储：任务和其中的每个链接保存在SQLite中，进程重启或者多进程运行时都从同一个数据库中领取链接。
+# 链接的状态：pending（排队中）、running（解析中）、done（已完成）
+class JobStore:
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=10, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0, succeeded INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+            "deadline REAL, verbosity TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL);"
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, url TEXT NOT NULL, state TEXT NOT NULL, "
+            "claim TEXT, claimed_at REAL, result TEXT, UNIQUE (job_id, position));"
+            "CREATE INDEX IF NOT EXISTS job_items_state ON job_items (state);"
+        )
+
+    # 创建任务，返回任务ID
+    def create(self, urls, deadline, verbosity):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT INTO jobs (id, status, total, deadline, verbosity, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                    (job_id, len(urls), deadline, verbosity, time.time()),
+                )
+                self.conn.executemany(
+                    "INSERT INTO job_items (job_id, position, url, state) VALUES (?, ?, ?, 'pending')",
+                    ((job_id, position, url) for position, url in enumerate(urls)),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    # 按提交顺序领取下一个排队中的链接，没有时返回None；claim用于确认完成时这个链接没有被重新排队后交给别人
+    def claim(self):
+        now = time.time()
+        claim = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT i.rowid, i.job_id, i.position, i.url, j.deadline, j.verbosity "
+                    "FROM job_items i JOIN jobs j ON j.id = i.job_id WHERE i.state = 'pending' ORDER BY i.rowid LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute("UPDATE job_items SET state = 'running', claim = ?, claimed_at = ? WHERE rowid = ?", (claim, now, row[0]))
+                    self.conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'", (now, row[1]))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        rowid, job_id, position, url, deadline, verbosity = row
+        return {"rowid": rowid, "job_id": job_id, "position": position, "url": url, "deadline": deadline, "verbosity": verbosity, "claim": claim}
+
+    # 保存链接的解析结果并更新任务进度，所有链接都完成时任务结束
+    def complete(self, item, result):
+        now = time.time()
+        success = result.get("status") == "success"
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self.conn.execute(
+                    "UPDATE job_items SET state = 'done', result = ? WHERE rowid = ? AND state = 'running' AND claim = ?",
+                    (orjson.dumps(result).decode("utf-8"), item["rowid"], item["claim"]),
+                ).rowcount
+                if updated:
+                    self.conn.execute(
+                        "UPDATE jobs SET completed = completed + 1, succeeded = succeeded + ?, failed = failed + ? WHERE id = ?",
+                        (int(success), int(not success), item["job_id"]),
+                    )
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ? AND completed = total",
+                        (now, item["job_id"]),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # 把领取超过lease_timeout秒仍未完成的链接重新排队（例如解析中的进程已经退出），返回重新排队的数量
+    def requeue_expired(self, lease_timeout):
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE job_items SET state = 'pending', claim = NULL, claimed_at = NULL WHERE state = 'running' AND claimed_at <= ?",
+                (time.time() - lease_timeout,),
+            ).rowcount
+
+    # 删除在before之前完成的任务，返回删除的任务数
+    def delete_finished(self, before):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM job_items WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)", (before,))
+                deleted = self.conn.execute("DELETE FROM jobs WHERE finished_at < ?", (before,)).rowcount
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    # 任务概况，任务不存在时返回None
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, total, completed, succeeded, failed, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, total, completed, succeeded, failed, created_at, started_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "progress": {
+                "total": total,
+                "completed": completed,
+                "success": succeeded,
+                "error": failed,
+                "percent": round(completed * 100 / total, 1) if total else 100.0,
+            },
         }
-        
+
+    # 按输入顺序读取从offset开始的limit个链接的状态和结果
+    def items(self, job_id, offset, limit):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT position, url, state, result FROM job_items WHERE job_id = ? AND position >= ? ORDER BY position LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [
+            {"index": position, "url": url, "state": state, **(orjson.loads(result) if result else {})}
+            for position, url, state, result in rows
+        ]
+
+    # 所有任务中各个状态的链接数
+    def state_counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM job_items GROUP BY state").fetchall()
+        return {"pending": 0, "running": 0, "done": 0, **dict(rows)}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+job_store = None
+
+# 获取异步任务存储（首次使用时打开数据库）
+def get_job_store():
+    global job_store
+    if job_store is None:
+        job_store = JobStore(get_settings("jobs")["path"])
+    return job_store
+
+# 异步任务的后台解析：workers个协程各自从任务存储中领取链接并解析，定期把超时的链接重新排队、删除过期的任务
+class JobRunner:
+    # 重新排队和删除过期任务的间隔（秒）
+    MAINTENANCE_INTERVAL = 60
+
+    def __init__(self, store, settings):
+        self.store = store
+        self.settings = settings
+        self.wakeup = asyncio.Event()
+
+    # 有新任务时唤醒空闲的协程，不用等到下一次检查
+    def wake(self):
+        self.wakeup.set()
+
+    # 数据库访问连续出错时的最长等待时间（秒）
+    MAX_BACKOFF = 30
+
+    # 领取并解析一个链接，没有排队中的链接时等待新任务；返回是否领取到了链接
+    async def process_next(self):
+        self.wakeup.clear()
+        item = await asyncio.to_thread(self.store.claim)
+        if item is None:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.settings["poll_interval"])
+            except asyncio.TimeoutError:
+                pass
+            return False
+        try:
+            result = await parse_link(item["url"], item["deadline"])
+        except Exception as e:
+            result = {"status": "error", "message": "解析失败", "debug_info": str(e)}
+        await asyncio.to_thread(self.store.complete, item, shape_result(result, item["verbosity"]))
+        metrics.inc("douyin_job_items_total", {"status": result["status"]})
+        return True
+
+    # 数据库出错（例如多个进程同时写入时被锁住）时记录日志并等待一段时间重试，等待时间随连续出错次数加倍；
+    # 保存结果失败的链接会在领取超时后重新排队
+    async def worker(self):
+        failures = 0
+        while True:
+            try:
+                await self.process_next()
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.warning("处理异步任务失败（连续%s次）", failures, exc_info=True)
+                await asyncio.sleep(min(self.settings["poll_interval"] * 2 ** failures, self.MAX_BACKOFF))
+
+    # 把超时的链接重新排队并删除过期的任务
+    async def maintain(self, lease_timeout):
+        requeued = await asyncio.to_thread(self.store.requeue_expired, lease_timeout)
+        if requeued:
+            logger.warning("%s个链接解析超时未完成，已重新排队", requeued)
+        await asyncio.to_thread(self.store.delete_finished, time.time() - self.settings["retention"])
+
+    async def run(self):
+        # 单进程运行时，上次退出时还在解析中的链接不会再有人完成，在开始解析前立即重新排队
+        lease_timeout = 0 if shared_state is None else self.settings["lease_timeout"]
+        try:
+            await self.maintain(lease_timeout)
+        except Exception:
+            logger.warning("维护异步任务失败", exc_info=True)
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.settings["workers"])]
+        try:
+            while True:
+                await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+                try:
+                    await self.maintain(self.settings["lease_timeout"])
+                except Exception:
+                    logger.warning("维护异步任务失败", exc_info=True)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+job_runner = None
+job_runner_task = None
+
+# 获取异步任务的后台解析（首次使用时创建）
+def get_job_runner():
+    global job_runner
+    if job_runner is None:
+        job_runner = JobRunner(get_job_store(), get_settings("jobs"))
+    return job_runner
+
+# 开始在后台解析异步任务（只启动一次）；无法打开任务数据库（例如只读的无服务器环境）时不启动，返回是否在运行
+def start_job_runner():
+    global job_runner_task
+    if job_runner_task is None and get_settings("jobs")["enabled"]:
+        try:
+            runner = get_job_runner()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("无法打开异步任务数据库，异步任务不可用: %s", e)
+            return False
+        job_runner_task = asyncio.create_task(runner.run())
+    return job_runner_task is not None
+
+# 检查异步任务功能是否开启，并确保后台解析已经启动（没有经过startup事件启动时在这里启动）
+def check_jobs_enabled():
+    if not get_settings("jobs")["enabled"]:
+        raise HTTPException(status_code=404, detail="异步任务功能未开启")
+    if not start_job_runner():
+        raise HTTPException(status_code=503, detail="异步任务数据库不可用")
+
+@app.post("/jobs")
+async def create_job(
+    batch: BatchParseRequest,
+    deadline: Optional[float] = Query(None, description="每个链接的解析时间预算（秒）"),
+    verbosity: Optional[str] = Query(None, description="返回内容：lean、default 或 debug"),
+    x_deadline: Optional[float] = Header(None, alias="X-Deadline"),
+    authorized: bool = Depends(verify_access)
+):
+    """
+    提交异步解析任务：立即返回任务ID，链接在后台解析，用GET /jobs/{job_id}查询进度和结果。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    check_jobs_enabled()
+    verbosity = check_verbosity(verbosity)
+    
+    max_links = get_settings("jobs")["max_links"]
+    if not batch.urls:
+        raise HTTPException(status_code=400, detail="没有需要解析的链接")
+    if len(batch.urls) > max_links:
+        raise HTTPException(status_code=400, detail=f"一个任务最多包含{max_links}个链接")
+    
+    job_id = await asyncio.to_thread(get_job_store().create, batch.urls, deadline or x_deadline, verbosity)
+    get_job_runner().wake()
+    return ORJSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(batch.urls),
+        "status_url": f"/jobs/{job_id}"
+    })
+
+@app.get("/jobs/{job_id}")
+async def job_status(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="从第几个链接开始返回结果"),
+    limit: Optional[int] = Query(None, ge=1, description="返回的链接数"),
+    authorized: bool = Depends(verify_access)
+):
+    """
+    查询异步解析任务：任务状态、解析进度，以及按输入顺序分页返回的每个链接的状态（pending/running/done）和结果。
+    """
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    check_jobs_enabled()
+    
+    settings = get_settings("jobs")
+    limit = min(limit or settings["page_size"], settings["max_page_size"])
+    store = get_job_store()
+    job = await asyncio.to_thread(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    
+    results = await asyncio.to_thread(store.items, job_id, offset, limit)
+    next_offset = offset + limit if offset + limit < job["progress"]["total"] else None
+    return ORJSONResponse(content={**job, "offset": offset, "limit": limit, "next_offset": next_offset, "results": results})
+
+VERBOSITY_LEVELS = ("lean", "default", "debug")
+
+# 检查返回内容级别，没有指定时使用配置中的默认级别
+def check_verbosity(verbosity=None):
+    verbosity = verbosity or get_settings("response")["verbosity"]
+    if verbosity not in VERBOSITY_LEVELS:
+        raise HTTPException(status_code=400, detail="verbosity只支持lean、default或debug")
+    return verbosity
+
+# 调试信息环形缓冲区：按request_id保存最近若干次解析的完整调试信息，超出容量时丢弃最早的记录
+class DebugBuffer:
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def add(self, request_id, entry):
+        with self.lock:
+            self.entries[request_id] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def get(self, request_id):
+        with self.lock:
+            return self.entries.get(request_id)
+
+debug_buffer = None
+
+# 获取调试信息缓冲区（首次使用时创建）
+def get_debug_buffer():
+    global debug_buffer
+    if debug_buffer is None:
+        debug_buffer = DebugBuffer(get_settings("response")["debug_buffer_size"])
+    return debug_buffer
+
+# 按返回内容级别裁剪解析结果：lean去掉调试信息，default去掉调试信息中的HTML片段，debug原样返回
+def shape_result(result, verbosity):
+    if verbosity == "debug":
+        return result
+    
+    def shape_debug_info(container):
+        shaped = {key: value for key, value in container.items() if key != "debug_info"}
+        debug_info = container.get("debug_info")
+        if verbosity == "default" and debug_info is not None:
+            if isinstance(debug_info, dict):
+                debug_info = {key: value for key, value in debug_info.items() if key != "html_sample"}
+            shaped["debug_info"] = debug_info
+        return shaped
+    
+    shaped = shape_debug_info(result)
+    if isinstance(result.get("data"), dict):
+        shaped["data"] = shape_debug_info(result["data"])
+    return shaped
+
+# 计算解析时间预算（秒）：没有指定时使用默认值，并限制在配置的范围内
+def get_deadline_budget(requested=None):
+    settings = get_settings("deadline")
+    budget = requested if requested and requested > 0 else settings["default"]
+    return min(max(budget, settings["min"]), settings["max"])
+
+# 解析单个抖音链接，返回带request_id的结果字典（没有指定request_id时自动生成）；deadline是客户端指定的时间预算（秒），
+# 预算用完时立即返回错误，以及已经获取到的部分视频信息；prefetched是批量解析时预先读取的缓存
+async def parse_link(url, deadline=None, request_id=None, prefetched=None):
+    budget = get_deadline_budget(deadline)
+    request_id = request_id or uuid.uuid4().hex
+    # 本次解析的上下文，各个策略从页面中提取的视频信息会记录在这里
+    parse_context = ParseContext(time.monotonic() + budget, request_id)
+    if prefetched is not None:
+        parse_context.prefetched = prefetched
+    current_parse.set(parse_context)
+    
+    # 第一步：处理输入的URL，确保格式正确
+    if not url.startswith('http'):
+        url = 'https://' + url
+    
+    # 记录调试信息
+    debug_info = {
+        "original_url": url,
+        "deadline": budget,
+    }
+    
+    try:
+        result = await parse_link_with_deadline(url, budget, parse_context, debug_info)
+    finally:
+        parse_context.cancel_fetches()
+    # 完整的调试信息保存在服务端，返回内容中只带request_id
+    get_debug_buffer().add(request_id, {
+        "request_id": request_id,
+        "time": int(time.time()),
+        "url": url,
+        "status": result["status"],
+        "debug_info": result["data"].get("debug_info") if "data" in result else result.get("debug_info"),
+    })
+    return {"request_id": request_id, **result}
+
+# 在时间预算内执行解析的各个步骤，超时时返回错误和已经获取到的部分视频信息
+async def parse_link_with_deadline(url, budget, parse_context, debug_info):
+    try:
+        return await asyncio.wait_for(parse_link_steps(url, parse_context, debug_info), timeout=budget)
+    except asyncio.TimeoutError:
+        logger.warning("解析超时（%s秒）: %s", budget, url)
+        result = {
+            "status": "error",
+            "message": "解析超时",
+            "debug_info": debug_info
+        }
+        if parse_context.page_info:
+            result["partial"] = {
+                "title": parse_context.page_info["title"],
+                "cover_image": parse_context.page_info["cover_image"],
+                "duration": parse_context.page_info["duration"],
+            }
+        return result
+
+# 请求分享链接并逐跳跟踪重定向：设备身份的Cookie只发给抖音域名，也只保存抖音域名的响应下发的Cookie；
+# 其他域名（包括重定向经过的域名）每一跳都使用一次性的随机Cookie。返回最后一跳的响应
+async def fetch_share_page(url, headers, identity=None, max_hops=10):
+    for _ in range(max_hops + 1):
+        use_identity = identity is not None and host_in_domains(url_host(url), DOUYIN_PAGE_DOMAINS)
+        cookie_str = identity.cookie_header() if use_identity else cookies_to_string(generate_douyin_cookies())
+        resp = await get_http_client().get(url, headers={**headers, 'Cookie': cookie_str})
+        # 身份沿用这次服务端下发的Cookie
+        if use_identity:
+            identity.absorb(resp)
+        if not resp.is_redirect:
+            return resp
+        url = str(resp.url.join(resp.headers["Location"]))
+    raise httpx.TooManyRedirects(f"超过{max_hops}次重定向: {url}")
+
+# 解析单个抖音链接的各个步骤
+async def parse_link_steps(url, parse_context, debug_info):
+    try:
         # 尝试方法1: 直接从URL提取视频ID
         video_id = extract_video_id(url)
         
-        # 如果URL中没有视频ID，尝试请求短链接获取重定向URL
+        # 如果URL中没有视频ID，先查找之前保存的短链接映射
+        short_link_settings = get_settings("short_link_cache")
+        if not video_id and short_link_settings["enabled"]:
+            short_link = normalize_short_link(url)
+            prefetched = parse_context.prefetched["short_link"]
+            video_id = prefetched[short_link] if short_link in prefetched else await get_short_link_cache().get(short_link)
+            debug_info["video_id_from_short_link_cache"] = video_id
+        
+        # 如果仍然没有视频ID，尝试请求短链接获取重定向URL
         if not video_id:
+            # 使用身份池中的设备身份，关闭身份池时每次生成新的随机Cookie
+            identity = get_identity_pool().acquire() if get_settings("identity_pool")["enabled"] else None
             try:
-                # 生成随机Cookie
-                cookies = generate_douyin_cookies()
-                cookie_str = cookies_to_string(cookies)
+                if identity is not None:
+                    user_agent = identity.user_agent
+                    debug_info["identity"] = identity.id
+                else:
+                    user_agent = PC_UA
                 
                 # 设置请求头，模拟真实浏览器
-                pc_headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+                headers = {
+                    'User-Agent': user_agent,
                     'Referer': 'https://www.douyin.com/',
                     'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                    'Cookie': cookie_str,
                     'Connection': 'keep-alive',
                     'Upgrade-Insecure-Requests': '1',
                 }
                 
                 # 请求短链接，获取重定向后的真实URL
-                resp = requests.get(url, headers=pc_headers, timeout=15, allow_redirects=True)
-                final_url = resp.url
+                resp = await fetch_share_page(url, headers, identity)
+                final_url = str(resp.url)
                 debug_info["final_url"] = str(final_url)
                 debug_info["status_code"] = resp.status_code
                 
                 # 从重定向URL中提取视频ID
                 video_id = extract_video_id(final_url)
                 debug_info["video_id_from_redirect"] = video_id
+                if video_id and short_link_settings["enabled"]:
+                    await get_short_link_cache().set(normalize_short_link(url), video_id)
                 
-                # 保存HTML前1000个字符用于调试
+                # 没有得到视频ID算作身份的一次失败
+                if identity is not None:
+                    get_identity_pool().report(identity, bool(video_id))
+                
+                # 分享页中带有视频的标题、封面等信息；只信任抖音域名的页面，其他网站的页面数据可能是伪造的
                 html = resp.text
+                if host_in_domains(resp.url.host, DOUYIN_PAGE_DOMAINS):
+                    remember_page_info(extract_page_info(html))
+                
+                # 保存HTML前1000个字符用于调试
                 html_length = len(html)
                 debug_info["html_length"] = html_length
                 debug_info["html_sample"] = html[:1000] if len(html) > 1000 else html
             except Exception as e:
                 debug_info["method1_error"] = str(e)
+                if identity is not None:
+                    get_identity_pool().report(identity, False)
         
         debug_info["video_id"] = video_id
         
         # 如果找到视频ID，尝试获取视频信息
         if video_id:
-            # 尝试使用通用方法获取真实视频地址
-            try:
-                video_url, method = get_universal_video_url(video_id)
-                if video_url:
-                    result = {
-                        "status": "success",
-                        "data": {
-                            "video_url": video_url,
-                            "title": f"抖音视频_{video_id}",
-                            "cover_image": "未找到封面",
-                            "video_id": video_id,
-                            "method": method,
-                            "debug_info": debug_info
-                        }
-                    }
-                    return JSONResponse(content=result)
-            except Exception as e:
-                debug_info["universal_method_error"] = str(e)
+            # 优先使用缓存的解析结果
+            cache_settings = get_settings("result_cache")
+            cached = None
+            if cache_settings["enabled"]:
+                prefetched = parse_context.prefetched["result"]
+                cached = prefetched[video_id] if video_id in prefetched else await get_result_cache().get(video_id)
+            if cached:
+                debug_info["cache"] = "hit"
+                return {"status": "success", "data": {**cached, "debug_info": debug_info}}
             
-            # 尝试使用通用方法获取真实视频地址
-            try:
-                video_url, method = parse_video_format_url(video_id)
-                if video_url:
-                    result = {
-                        "status": "success",
-                        "data": {
-                            "video_url": video_url,
-                            "title": f"抖音视频_{video_id}",
-                            "cover_image": "未找到封面",
-                            "video_id": video_id,
-                            "method": method,
-                            "debug_info": debug_info
-                        }
-                    }
-                    return JSONResponse(content=result)
-            except Exception as e:
-                debug_info["parse_video_format_url_error"] = str(e)
+            # 同一个视频ID同时只解析一次，并发的相同请求共享解析结果
+            async def resolve_and_cache():
+                resolve_debug_info = {}
+                started_at = time.monotonic()
+                # 短链接跳转到的页面中已经带有播放地址时直接使用，不再请求其他页面
+                video_url = pick_douyinvod_url(current_parse.get().page_info)
+                method = "从分享页数据中提取"
+                if not video_url:
+                    # 解析在独立的任务中进行，外层的超时取消不到这里，需要单独按剩余的时间预算限制；
+                    # 超时后取消各个策略，策略发起的上游请求也随之取消
+                    try:
+                        video_url, method = await asyncio.wait_for(
+                            resolve_video_id(video_id, resolve_debug_info),
+                            timeout=current_parse.get().remaining(),
+                        )
+                    except asyncio.TimeoutError:
+                        resolve_debug_info["resolve_error"] = "解析时间预算已用完"
+                        video_url, method = None, None
+                metrics.inc("douyin_resolve_total", {"method": method or "failed"})
+                metrics.observe("douyin_resolve_duration_seconds", {"method": method or "failed"}, time.monotonic() - started_at)
+                if not video_url:
+                    return None, resolve_debug_info
+                # 标题、封面、时长和各个清晰度来自解析过程中读取到的页面状态数据
+                page_info = current_parse.get().page_info or {}
+                data = {
+                    "video_url": video_url,
+                    "title": page_info.get("title") or f"抖音视频_{video_id}",
+                    "cover_image": page_info.get("cover_image") or "未找到封面",
+                    "video_id": video_id,
+                    "method": method,
+                    "duration": page_info.get("duration"),
+                    "bitrates": page_info.get("bitrates", []),
+                }
+                if cache_settings["enabled"] and method not in FIXED_FORMAT_METHODS:
+                    await get_result_cache().set(video_id, data)
+                return data, resolve_debug_info
+            
+            data, resolve_debug_info = await single_flight.do(video_id, resolve_and_cache)
+            debug_info.update(resolve_debug_info)
+            debug_info["memo_hits"] = parse_context.memo_hits
+            if data:
+                result = {
+                    "status": "success",
+                    "data": {**data, "debug_info": debug_info}
+                }
+                return result
             
             # 如果所有方法都失败，返回错误信息
             result = {
@@ -633,7 +3462,7 @@ def parse_douyin_link(
                 "message": "无法获取视频信息",
                 "debug_info": debug_info
             }
-            return JSONResponse(content=result)
+            return result
         
         # 如果没有找到视频ID，返回错误信息
         result = {
@@ -641,10 +3470,172 @@ def parse_douyin_link(
             "message": "无法从URL中提取视频ID",
             "debug_info": debug_info
         }
-        return JSONResponse(content=result)
+        return result
     except Exception as e:
-        print(f"解析抖音短视频链接失败: {e}")
-        return JSONResponse(content={"status": "error", "message": "解析失败", "debug_info": str(e)})
+        logger.error("解析抖音短视频链接失败: %s", e, exc_info=True)
+        return {"status": "error", "message": "解析失败", "debug_info": str(e)}
+
+shared_state_task = None
+
+# 多进程模式的后台任务：定期检查其他进程是否修改了配置，并发布本进程的监控指标
+async def watch_shared_state():
+    while True:
+        try:
+            version = await asyncio.to_thread(shared_state.config_version)
+            if version != config_version:
+                apply_shared_config(*await asyncio.to_thread(shared_state.load_config))
+            await asyncio.to_thread(shared_state.publish_metrics, WORKER_ID, metrics.export())
+        except Exception:
+            logger.warning("同步共享状态失败", exc_info=True)
+        await asyncio.sleep(get_settings("multi_worker")["poll_interval"])
+
+# 启动预热的状态：pending（还没有开始）、warming_up（进行中）、ready（已完成，包括超时）
+warmup_status = {"state": "pending", "started_at": None, "finished_at": None, "hosts": {}}
+warmup_task = None
+
+# 预热页面解析：让各个提取正则和页面状态解析在第一次真实解析之前执行一次
+WARMUP_PAGE = (
+    '<script id="RENDER_DATA" type="application/json">'
+    + urllib.parse.quote(json.dumps({"app": {"videoDetail": {"desc": "", "video": {"play_addr": {"url_list": []}}}}}))
+    + '</script>"playApi": "https://aweme.snssdk.com/aweme/v1/play/?video_id=0"'
+)
+
+# 预热一个上游域名：解析DNS并建立一个长连接
+async def warm_up_host(client, host):
+    started_at = time.monotonic()
+    result = {}
+    try:
+        if client.dns_cache is not None:
+            result["addresses"] = await client.dns_cache.resolve(host, 443)
+        result["status_code"] = await client.warm_connection(f"https://{host}/")
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.monotonic() - started_at, 3)
+    warmup_status["hosts"][host] = result
+
+async def warm_up_steps(settings):
+    # 提前创建首次使用时才创建的对象
+    client = get_http_client()
+    get_result_cache()
+    if get_settings("short_link_cache")["enabled"]:
+        get_short_link_cache()
+    # 建立到共享缓存后端的连接，后端不可用时不影响启动，解析时只使用本地缓存
+    if redis_client is not None:
+        try:
+            await redis_client.execute_many([["PING"]])
+        except CACHE_BACKEND_ERRORS as e:
+            logger.warning("无法连接共享缓存后端: %s: %s", type(e).__name__, e)
+    get_strategy_stats()
+    get_circuit_breakers()
+    get_debug_buffer()
+    
+    extract_video_id("https://www.douyin.com/video/0")
+    extract_page_info(WARMUP_PAGE)
+    scan_page_buffer(WARMUP_PAGE, {"douyinvod": DOUYINVOD_PATTERN, "play_api": PLAY_API_PATTERN}, {"douyinvod": None, "play_api": None}, finished=True)
+    
+    await asyncio.gather(*(warm_up_host(client, host) for host in settings["hosts"]))
+
+# 启动预热，超时或出错时也标记为就绪，不影响正常解析
+async def warm_up(settings):
+    warmup_status.update(state="warming_up", started_at=time.time())
+    try:
+        await asyncio.wait_for(warm_up_steps(settings), timeout=settings["timeout"])
+    except asyncio.TimeoutError:
+        warmup_status["timed_out"] = True
+        logger.warning("启动预热超过%s秒，跳过剩余步骤", settings["timeout"])
+    except Exception:
+        logger.warning("启动预热失败", exc_info=True)
+    warmup_status.update(state="ready", finished_at=time.time())
+    logger.info("启动预热完成")
+
+# 开始启动预热（只执行一次）；关闭预热时直接标记为就绪
+def start_warm_up():
+    global warmup_task
+    if warmup_status["state"] != "pending":
+        return
+    settings = get_settings("warmup")
+    if not settings["enabled"]:
+        warmup_status.update(state="ready", finished_at=time.time())
+        return
+    warmup_status["state"] = "warming_up"
+    warmup_task = asyncio.create_task(warm_up(settings))
+
+@app.get("/ready")
+async def readiness():
+    """
+    就绪检查：启动预热完成后返回200，预热进行中返回503。
+    """
+    # 没有经过startup事件启动时（例如部分无服务器环境），在第一次检查时开始预热
+    start_warm_up()
+    status_code = 200 if warmup_status["state"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=warmup_status)
+
+# 为Vercel部署添加的代码
+@app.on_event("startup")
+async def startup_event():
+    # 确保配置目录存在
+    config_dir.mkdir(exist_ok=True)
+    # 加载配置；多进程模式下以共享状态中的配置为准，并在后台同步其他进程的修改
+    global CONFIG, shared_state_task
+    if shared_state is not None:
+        await refresh_shared_config()
+        shared_state_task = asyncio.create_task(watch_shared_state())
+    else:
+        CONFIG = load_config()
+    # 在后台预热设备身份池
+    global identity_pool_task
+    if get_settings("identity_pool")["enabled"]:
+        identity_pool_task = asyncio.create_task(get_identity_pool().run())
+    # 在后台解析异步任务中的链接，包括上次退出前还没有完成的
+    start_job_runner()
+    # 在后台进行启动预热，完成后/ready返回就绪
+    start_warm_up()
+    logger.info("应用启动完成，配置已加载")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 停止设备身份池的后台预热
+    global identity_pool_task
+    if identity_pool_task is not None:
+        identity_pool_task.cancel()
+        identity_pool_task = None
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if shared_state_task is not None:
+        shared_state_task.cancel()
+    # 停止异步任务的后台解析，解析中的链接在下次启动时重新排队
+    global job_runner_task, job_runner, job_store
+    if job_runner_task is not None:
+        job_runner_task.cancel()
+        try:
+            await job_runner_task
+        except asyncio.CancelledError:
+            pass
+        job_runner_task = None
+    job_runner = None
+    if job_store is not None:
+        job_store.close()
+        job_store = None
+    # 关闭上游连接池
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    # 关闭短链接映射数据库和共享缓存后端的连接
+    global short_link_cache, result_cache
+    if short_link_cache is not None:
+        await short_link_cache.close()
+        short_link_cache = None
+    if result_cache is not None:
+        await result_cache.close()
+        result_cache = None
+
+# 添加一个简单的测试路由
+@app.get("/test")
+def test():
+    return {"message": "API is working!"}
 
 import uvicorn
 import webbrowser
@@ -667,19 +3658,11 @@ if __name__ == "__main__":
     # 启动服务器
     print("抖音视频解析工具启动中...")
     print("默认登录密码:", ACCESS_PASSWORD)
-    uvicorn.run(app, host="127.0.0.1", port=8000)
-
-# 为Vercel部署添加的代码
-@app.on_event("startup")
-async def startup_event():
-    # 确保配置目录存在
-    config_dir.mkdir(exist_ok=True)
-    # 加载配置
-    global CONFIG
-    CONFIG = load_config()
-    print("应用启动完成，配置已加载")
-
-# 添加一个简单的测试路由
-@app.get("/test")
-def test():
-    return {"message": "API is working!"}
+    multi_worker_settings = get_settings("multi_worker")
+    if multi_worker_settings["enabled"]:
+        # 多进程模式：每个CPU核一个进程，进程之间通过共享状态同步配置和缓存
+        workers = multi_worker_settings["workers"] or os.cpu_count() or 1
+        print(f"多进程模式，启动{workers}个进程")
+        uvicorn.run("main:app", host="127.0.0.1", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=8000)
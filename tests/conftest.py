@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# main.py使用相对路径读取配置和模板，测试在项目目录中运行
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+os.chdir(REPO_DIR)
@@ -0,0 +1,46 @@
+"""
+设备身份Cookie的测试：身份的Cookie只发给抖音域名，也只保存抖音域名下发的Cookie
+"""
+import asyncio
+
+import httpx
+
+import main
+
+# 按链接返回预先准备好的响应，并记录每次请求带的Cookie
+class RedirectingClient:
+    def __init__(self, routes):
+        self.routes = routes
+        self.sent_cookies = {}
+
+    async def get(self, url, headers=None):
+        self.sent_cookies[url] = headers["Cookie"]
+        status_code, response_headers = self.routes[url]
+        return httpx.Response(status_code, headers=response_headers, request=httpx.Request("GET", url))
+
+def test_fetch_share_page_keeps_identity_on_douyin_hosts(monkeypatch):
+    client = RedirectingClient({
+        "https://evil.example/s/abc": (302, [("Location", "https://v.douyin.com/abc/"), ("Set-Cookie", "sessionid=evil")]),
+        "https://v.douyin.com/abc/": (302, [("Location", "https://www.iesdouyin.com/share/video/7345678901234567890/"), ("Set-Cookie", "s_v_web_id=fresh")]),
+        "https://www.iesdouyin.com/share/video/7345678901234567890/": (200, []),
+    })
+    monkeypatch.setattr(main, "get_http_client", lambda: client)
+    identity = main.DeviceIdentity()
+    identity_session = identity.cookies["sessionid"]
+
+    resp = asyncio.run(main.fetch_share_page("https://evil.example/s/abc", {}, identity))
+
+    assert str(resp.url) == "https://www.iesdouyin.com/share/video/7345678901234567890/"
+    assert identity_session not in client.sent_cookies["https://evil.example/s/abc"]
+    assert "s_v_web_id=fresh" in client.sent_cookies["https://www.iesdouyin.com/share/video/7345678901234567890/"]
+    assert identity.cookies["sessionid"] == identity_session
+    assert identity.cookies["s_v_web_id"] == "fresh"
+
+def test_absorb_ignores_other_hosts():
+    identity = main.DeviceIdentity()
+    redirect = httpx.Response(302, headers=[("Set-Cookie", "sessionid=evil")], request=httpx.Request("GET", "https://evil.example/"))
+    response = httpx.Response(200, headers=[("Set-Cookie", "odin_tt=ok")], request=httpx.Request("GET", "https://www.douyin.com/"))
+    response.history = [redirect]
+    identity.absorb(response)
+    assert identity.cookies["sessionid"] != "evil"
+    assert identity.cookies["odin_tt"] == "ok"
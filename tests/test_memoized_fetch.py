@@ -0,0 +1,59 @@
+"""
+同一次解析中上游请求去重的测试：请求只在最后一个等待的调用方被取消时取消
+"""
+import asyncio
+
+import main
+
+def test_memoized_fetch_cancels_after_last_waiter():
+    async def scenario():
+        parse_context = main.ParseContext()
+        main.current_parse.set(parse_context)
+        started = []
+
+        async def fetch():
+            started.append(True)
+            await asyncio.sleep(10)
+            return "page"
+
+        key = ("page", "https://www.douyin.com/video/1")
+        first = asyncio.create_task(main.memoized_fetch(key, fetch))
+        second = asyncio.create_task(main.memoized_fetch(key, fetch))
+        await asyncio.sleep(0)
+        upstream = parse_context.fetches[key]
+
+        # 还有另一个调用方在等待，请求继续进行
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert not upstream.done()
+
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert upstream.cancelled()
+
+        # 之后相同的请求重新发起，不会拿到已经取消的结果
+        third = asyncio.create_task(main.memoized_fetch(key, fetch))
+        await asyncio.sleep(0.01)
+        assert parse_context.fetches[key] is not upstream
+        assert len(started) == 2
+        third.cancel()
+        await asyncio.gather(third, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+def test_cancel_fetches_keeps_awaited_requests():
+    async def scenario():
+        parse_context = main.ParseContext()
+        main.current_parse.set(parse_context)
+        orphan = asyncio.ensure_future(asyncio.sleep(10))
+        parse_context.fetches[("page", "a")] = orphan
+        waiter = asyncio.create_task(main.memoized_fetch(("page", "b"), lambda: asyncio.sleep(0.05, "ok")))
+        await asyncio.sleep(0)
+        parse_context.cancel_fetches()
+        await asyncio.sleep(0)
+        assert orphan.cancelled()
+        assert await waiter == "ok"
+
+    asyncio.run(scenario())
@@ -0,0 +1,146 @@
+"""
+页面状态数据解析的测试，使用tests/fixtures中保存的页面：
+- video_page_render_data.html   网页版视频页面，RENDER_DATA中是URL编码的JSON
+- share_page_router_data.html   分享页，window._ROUTER_DATA中是JSON
+"""
+import asyncio
+import contextlib
+from pathlib import Path
+
+import pytest
+
+import main
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+def load_fixture(name):
+    return (FIXTURES_DIR / name).read_text(encoding="utf-8")
+
+# 按固定大小分块返回页面内容的HTTP客户端，代替真实的上游连接
+class ChunkedPageClient:
+    def __init__(self, html, chunk_size):
+        self.html = html
+        self.chunk_size = chunk_size
+        self.requested = []
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, headers=None):
+        self.requested.append(url)
+        yield self
+
+    async def aiter_text(self):
+        for start in range(0, len(self.html), self.chunk_size):
+            yield self.html[start:start + self.chunk_size]
+
+def test_extract_page_info_from_render_data():
+    page_info = main.extract_page_info(load_fixture("video_page_render_data.html"))
+    assert page_info["title"] == "今天的晚霞 #日落 #城市"
+    assert page_info["cover_image"].startswith("https://p3-pc-sign.douyinpic.com/")
+    assert page_info["duration"] == 15.2
+    assert page_info["play_urls"][0].startswith("https://v3-web.douyinvod.com/")
+    assert len(page_info["play_urls"]) == 2
+    assert [variant["gear_name"] for variant in page_info["bitrates"]] == ["adapt_lowest_1080_1", "normal_720_0"]
+    assert page_info["bitrates"][1] == {
+        "gear_name": "normal_720_0",
+        "bit_rate": 1023456,
+        "width": 720,
+        "height": 1280,
+        "play_urls": ["https://v3-web.douyinvod.com/5f2c1e/66a1b2c3/video/tos/cn/tos-cn-ve-15/720p/?br=999&x-expires=1792310400"],
+    }
+
+def test_extract_page_info_from_router_data():
+    page_info = main.extract_page_info(load_fixture("share_page_router_data.html"))
+    assert page_info["title"] == "周末去海边 🌊"
+    assert page_info["cover_image"] == "https://p9-sign.douyinpic.com/tos-cn-p-0015/oB9c8d7~c5_300x400.jpeg"
+    assert page_info["duration"] == 9.8
+    assert page_info["play_urls"] == ["https://aweme.snssdk.com/aweme/v1/playwm/?video_id=v0300fg10000cl9a8b7c6d5e4f3g2h1i&ratio=720p&line=0"]
+    assert page_info["bitrates"][0]["width"] == 576
+    assert page_info["bitrates"][0]["height"] == 1024
+
+def test_extract_page_info_without_state():
+    assert main.extract_page_info("<html><body>没有页面状态数据</body></html>") is None
+    # 状态数据不是合法的JSON
+    assert main.extract_page_info('<script id="RENDER_DATA" type="application/json">%7B%22app%22</script>') is None
+
+def test_normalize_page_item_web_and_app_fields():
+    web_item = {
+        "desc": "网页版",
+        "video": {
+            "playAddr": [{"src": "//v3-web.douyinvod.com/a/"}],
+            "cover": "https://p3.douyinpic.com/a.jpeg",
+            "duration": 30000,
+            "bitRateList": [{"gearName": "normal_720_0", "bitRate": 1000, "width": 720, "height": 1280, "playAddr": [{"src": "//v3-web.douyinvod.com/b/"}]}],
+        },
+    }
+    app_item = {
+        "desc": "分享页",
+        "duration": 12,
+        "video": {
+            "play_addr": {"url_list": ["https://v9-default.douyinvod.com/a/"]},
+            "origin_cover": {"url_list": ["https://p9.douyinpic.com/a.jpeg"]},
+            "bit_rate": [{"gear_name": "normal_540_0", "bit_rate": 800, "play_addr": {"width": 540, "height": 960, "url_list": ["https://v9-default.douyinvod.com/b/"]}}],
+        },
+    }
+    web_info = main.normalize_page_item(web_item)
+    app_info = main.normalize_page_item(app_item)
+    assert web_info["play_urls"] == ["https://v3-web.douyinvod.com/a/"]
+    assert web_info["duration"] == 30
+    assert web_info["bitrates"][0]["play_urls"] == ["https://v3-web.douyinvod.com/b/"]
+    assert app_info["cover_image"] == "https://p9.douyinpic.com/a.jpeg"
+    # 以秒为单位的时长保持不变
+    assert app_info["duration"] == 12
+    assert app_info["bitrates"][0]["width"] == 540
+    assert main.normalize_page_item({"desc": "", "video": {}}) == {
+        "title": None,
+        "cover_image": None,
+        "duration": None,
+        "play_urls": [],
+        "bitrates": [],
+    }
+
+def test_pick_douyinvod_url_falls_back_to_bitrates():
+    page_info = main.extract_page_info(load_fixture("share_page_router_data.html"))
+    assert main.pick_douyinvod_url(page_info).startswith("https://v9-default.douyinvod.com/")
+    assert main.pick_douyinvod_url(None) is None
+
+# 分块大小覆盖起始标记、状态数据和</script>被分块边界切开的情况
+@pytest.mark.parametrize("chunk_size", [7, 61, 512, 4096, 1 << 20])
+@pytest.mark.parametrize("fixture", ["video_page_render_data.html", "share_page_router_data.html"])
+def test_fetch_and_scan_video_page_with_split_state(monkeypatch, fixture, chunk_size):
+    html = load_fixture(fixture)
+    client = ChunkedPageClient(html, chunk_size)
+    monkeypatch.setattr(main, "get_http_client", lambda: client)
+
+    async def scan():
+        main.current_parse.set(main.ParseContext())
+        found = await main.fetch_and_scan_video_page("7345678901234567890", main.PC_UA)
+        return found, main.current_parse.get().page_info
+
+    found, remembered = asyncio.run(scan())
+    assert client.requested == ["https://www.douyin.com/video/7345678901234567890"]
+    assert found["page_info"] == main.extract_page_info(html)
+    assert remembered == found["page_info"]
+    assert main.pick_douyinvod_url(found["page_info"])
+
+def test_fetch_and_scan_video_page_without_state(monkeypatch):
+    html = load_fixture("video_page_render_data.html").replace('id="RENDER_DATA"', 'id="OTHER_DATA"')
+    monkeypatch.setattr(main, "get_http_client", lambda: ChunkedPageClient(html, 512))
+    found = asyncio.run(main.fetch_and_scan_video_page("7345678901234567890", main.PC_UA))
+    assert found["page_info"] is None
+    assert found["douyinvod"] is None
+    assert found["play_api"] == "https:\\u002F\\u002Fwww.douyin.com\\u002Faweme\\u002Fv1\\u002Fplay\\u002F?video_id=v0200fg10000cm1a2b3c4d5e6f7g8h9i&ratio=720p"
+
+def test_pick_douyinvod_url_checks_host():
+    page_info = {
+        "play_urls": ["https://evil.example/douyinvod.com/payload.mp4", "https://douyinvod.com.evil.example/a.mp4"],
+        "bitrates": [{"play_urls": ["https://v26-web.douyinvod.com/b/"]}],
+    }
+    assert main.pick_douyinvod_url(page_info) == "https://v26-web.douyinvod.com/b/"
+    page_info["bitrates"] = []
+    assert main.pick_douyinvod_url(page_info) is None
+
+def test_host_in_domains():
+    assert main.host_in_domains("www.douyin.com", main.DOUYIN_PAGE_DOMAINS)
+    assert main.host_in_domains("douyin.com", main.DOUYIN_PAGE_DOMAINS)
+    assert not main.host_in_domains("evildouyin.com", main.DOUYIN_PAGE_DOMAINS)
+    assert not main.host_in_domains("douyin.com.evil.example", main.DOUYIN_PAGE_DOMAINS)